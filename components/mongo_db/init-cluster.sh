@@ -2,6 +2,44 @@
 
 set -e
 
+# Created once the cluster accepts authenticated connections, checked by the compose healthcheck
+READY_FILE=/tmp/mongo_cluster_ready
+# Maximum number of seconds to wait for each process to become ready
+READY_TIMEOUT=${MONGO_READY_TIMEOUT:-120}
+
+rm -f "$READY_FILE"
+
+now_ms() {
+  date +%s%3N
+}
+
+START_TIME=$(now_ms)
+PHASE_START_TIME=$START_TIME
+
+end_phase() {
+  local phase_end_time
+  phase_end_time=$(now_ms)
+  echo "$1 took $((phase_end_time - PHASE_START_TIME)) ms"
+  PHASE_START_TIME=$phase_end_time
+}
+
+# Run a mongosh expression against a port until it returns true, sleeping with a bounded exponential backoff
+wait_until() {
+  local port=$1
+  local description=$2
+  local expression=$3
+  local delay=0.1
+  local deadline=$(( $(date +%s) + READY_TIMEOUT ))
+  until [ "$(mongosh --port "$port" --quiet --eval "$expression" 2>/dev/null)" = "true" ]; do
+    if [ "$(date +%s)" -ge "$deadline" ]; then
+      echo "Timed out after ${READY_TIMEOUT}s waiting for $description"
+      exit 1
+    fi
+    sleep "$delay"
+    delay=$(awk -v delay="$delay" 'BEGIN { delay *= 2; print (delay > 2 ? 2 : delay) }')
+  done
+}
+
 echo "Starting config server..."
 mongod --configsvr \
        --replSet configReplSet \
@@ -11,7 +49,8 @@ mongod --configsvr \
        --fork \
        --logpath /data/configdb/config.log
 
-sleep 5
+wait_until 27019 "config server to accept connections" "db.adminCommand({ping: 1}).ok === 1"
+end_phase "Starting config server"
 
 echo "Initiating config replica set..."
 mongosh --port 27019 <<EOF
@@ -22,7 +61,8 @@ rs.initiate({
 })
 EOF
 
-sleep 5
+wait_until 27019 "config replica set primary" "db.hello().isWritablePrimary"
+end_phase "Initiating config replica set"
 
 echo "Starting shard server..."
 mongod --shardsvr \
@@ -33,7 +73,8 @@ mongod --shardsvr \
        --fork \
        --logpath /data/shard1/shard.log
 
-sleep 5
+wait_until 27018 "shard server to accept connections" "db.adminCommand({ping: 1}).ok === 1"
+end_phase "Starting shard server"
 
 echo "Initiating shard replica set..."
 mongosh --port 27018 <<EOF
@@ -43,7 +84,8 @@ rs.initiate({
 })
 EOF
 
-sleep 5
+wait_until 27018 "shard replica set primary" "db.hello().isWritablePrimary"
+end_phase "Initiating shard replica set"
 
 echo "Starting mongos..."
 mongos --configdb configReplSet/localhost:27019 \
@@ -52,13 +94,16 @@ mongos --configdb configReplSet/localhost:27019 \
        --fork \
        --logpath /data/mongos.log
 
-sleep 5
+wait_until 27017 "mongos to accept connections" "db.adminCommand({ping: 1}).ok === 1"
+end_phase "Starting mongos"
 
 echo "Adding shard to cluster..."
 mongosh --port 27017 <<EOF
 sh.addShard("shard1ReplSet/localhost:27018")
 EOF
 
+end_phase "Adding shard to cluster"
+
 echo "Creating admin user..."
 mongosh --port 27017 <<EOF
 use admin
@@ -69,7 +114,10 @@ db.createUser({
 })
 EOF
 
-echo "Cluster started successfully."
+end_phase "Creating admin user"
+
+touch "$READY_FILE"
+echo "Cluster started successfully in $(( $(now_ms) - START_TIME )) ms."
 
 # Keep container running
 tail -f /data/mongos.log
@@ -0,0 +1,33 @@
+#!/bin/bash
+# Run the ERA init scripts while the image is built so that the initialised datafiles are part of the image.
+# On start the database already exists and the entrypoint only opens the instance.
+
+set -e
+
+if [ "$ORACLE_PREINIT" != "true" ]; then
+  exit 0
+fi
+
+# Maximum number of seconds to wait for the init scripts to complete
+PREINIT_TIMEOUT=${PREINIT_TIMEOUT:-900}
+
+container-entrypoint.sh &
+entrypoint_pid=$!
+
+deadline=$(( $(date +%s) + PREINIT_TIMEOUT ))
+until [ -f /tmp/oracle_init_complete ]; do
+  if ! kill -0 "$entrypoint_pid" 2>/dev/null; then
+    echo "Oracle entrypoint exited before the init scripts completed"
+    exit 1
+  fi
+  if [ "$(date +%s)" -ge "$deadline" ]; then
+    echo "Timed out after ${PREINIT_TIMEOUT}s waiting for the init scripts"
+    exit 1
+  fi
+  sleep 2
+done
+
+# The entrypoint shuts the database down cleanly on SIGTERM, leaving consistent datafiles behind
+kill -TERM "$entrypoint_pid"
+wait "$entrypoint_pid" || true
+echo "Oracle database initialised at build time"
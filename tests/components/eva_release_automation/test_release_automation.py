@@ -1,19 +1,15 @@
-import json
 import os
 import tempfile
-from datetime import datetime
 
-from bson import Int64
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
-from ebi_eva_internal_pyutils.mongo_utils import get_mongo_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import execute_query, get_all_results_for_query
 
+from utils.checksum_verifier import assert_release_checksums
+from utils.connection_pool import metadata_connection
 from utils.docker_utils import copy_files_to_container, run_command_in_container
+from utils.fixture_utils import load_fixture
 from utils.test_with_docker_compose import TestWithDockerCompose, log_on_failure
+from utils.vcf_verifier import assert_vcf
 
-resources_dir = os.path.join(TestWithDockerCompose.resources_directory, 'release_automation')
-maven_settings_file = os.path.join(TestWithDockerCompose.root_dir, 'components', 'maven-settings.xml')
-maven_profile = 'localhost'
 
 class TestRunReleaseForSpecies(TestWithDockerCompose):
 
@@ -37,32 +33,7 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
         super().tearDown()
 
     def _add_data_to_docker(self):
-        inventory_table = 'eva_progress_tracker.clustering_release_tracker'
-        # Paths inside the executor Docker container (read-only volume mount)
-        fasta_file = '/opt/tests/release_automation/resources/GCA_000005425.2.fa'
-        report_file = '/opt/tests/release_automation/resources/GCA_000005425.2_assembly_report.txt'
-
-        with get_metadata_connection_handle(maven_profile, maven_settings_file) as conn:
-            insert_query = (
-                f"insert into {inventory_table} "
-                f"(taxonomy, scientific_name, assembly_accession, release_version, sources, fasta_path, "
-                f"report_path, should_be_released, num_rs_to_release, total_num_variants, release_folder_name) "
-                f"values (4530, 'Oryza sativa', 'GCA_000005425.2', 1, 'EVA', '{fasta_file}', "
-                f"'{report_file}', True, 1, 1, 'oryza_sativa')"
-            )
-            execute_query(conn, insert_query)
-
-        sves = read_mongo_data(os.path.join(resources_dir, 'submittedVariantEntities.json'))
-        cves = read_mongo_data(os.path.join(resources_dir, 'clusteredVariantEntities.json'))
-        svoe = read_mongo_data(os.path.join(resources_dir, 'submittedVariantOperationEntities.json'))
-        cvoe = read_mongo_data(os.path.join(resources_dir, 'clusteredVariantOperationEntities.json'))
-
-        with get_mongo_connection_handle(maven_profile, maven_settings_file) as mongo_handle:
-            db = mongo_handle['eva_accession_sharded']
-            db['dbsnpSubmittedVariantEntity'].insert_many(sves)
-            db['dbsnpClusteredVariantEntity'].insert_many(cves)
-            db['dbsnpSubmittedVariantOperationEntity'].insert_many(svoe)
-            db['dbsnpClusteredVariantOperationEntity'].insert_many(cvoe)
+        load_fixture('release_automation.yml', self.maven_profile, self.maven_settings_file)
 
     @log_on_failure
     def test_run_release_for_species(self):
@@ -112,6 +83,12 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
             '4530_GCA_000005425.2_deprecated_ids.txt.gz': '1',
             '4530_GCA_000005425.2_merged_ids.vcf.gz': '1',
         }
+        # Check the released VCFs hold the number of variants of the README, sorted and on contigs of the assembly
+        assembly_report = os.path.join(self.resources_directory, 'release_automation',
+                                       'GCA_000005425.2_assembly_report.txt')
+        for vcf_file in [expected_files[1], expected_files[3]]:
+            assert_vcf(vcf_file, assembly_report=assembly_report,
+                       expected_record_count=int(counts[os.path.basename(vcf_file)]))
 
         # Check completed status
         output = run_command_in_container(
@@ -162,6 +139,9 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
         assembly_dir = os.path.join(ftp_release_dir, 'by_assembly', 'GCA_000005425.2')
         assert os.path.isdir(assembly_dir), f'Expected assembly directory not found: {assembly_dir}'
 
+        # Check the published files match their md5checksums.txt
+        assert_release_checksums(ftp_release_dir)
+
     @log_on_failure
     def test_publish_release_to_ftp_uses_hard_links(self):
         assembly_accession = 'GCA_000005425.2'
@@ -178,15 +158,19 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
             'md5checksums.txt',
         ]
 
-        # Seed fake release v1 FTP files into the container
+        # Seed fake release v1 FTP files into the container, with the md5 of the empty files in md5checksums.txt
+        empty_file_md5 = 'd41d8cd98f00b204e9800998ecf8427e'
         with tempfile.TemporaryDirectory() as tmp_dir:
             for filename in release_filenames:
                 local_file = os.path.join(tmp_dir, filename)
-                open(local_file, 'w').close()
+                with open(local_file, 'w') as open_file:
+                    if filename == 'md5checksums.txt':
+                        open_file.writelines(f'{empty_file_md5}  {release_filename}\n'
+                                             for release_filename in release_filenames if release_filename != filename)
                 copy_files_to_container(self.container_name, container_v1_dir, local_file)
 
         # Insert release v2 tracking row with should_be_released=False
-        with get_metadata_connection_handle(maven_profile, maven_settings_file) as conn:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as conn:
             execute_query(conn,
                           "INSERT INTO eva_progress_tracker.clustering_release_tracker "
                           "(taxonomy, scientific_name, assembly_accession, release_version, sources, fasta_path, "
@@ -210,9 +194,15 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
             assert os.stat(v1_file).st_ino == os.stat(v2_file).st_ino, \
                 f'{filename} in release_2 should be a hard link to release_1 (same inode)'
 
+        # Files shared by both releases are only hashed once
+        summary = assert_release_checksums([os.path.join(self.test_run_dir, 'ftp', 'release_1'),
+                                            os.path.join(self.test_run_dir, 'ftp', 'release_2')])
+        assert summary['listed_files'] == 2 * (len(release_filenames) - 1)
+        assert summary['hashed_files'] == len(release_filenames) - 1
+
     @log_on_failure
     def test_create_release_tracking_table(self):
-        with get_metadata_connection_handle(maven_profile, maven_settings_file) as conn:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as conn:
             # Insert a clustered_variant_update entry so fill_should_be_released picks it up
             execute_query(conn,
                 "insert into evapro.clustered_variant_update "
@@ -226,7 +216,7 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
             'python3 -m release_automation.create_release_tracking_table --release-version 2'
         )
 
-        with get_metadata_connection_handle(maven_profile, maven_settings_file) as conn:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as conn:
             results = get_all_results_for_query(
                 conn,
                 "select should_be_released from eva_progress_tracker.clustering_release_tracker "
@@ -235,21 +225,3 @@ class TestRunReleaseForSpecies(TestWithDockerCompose):
         assert len(results) == 1, f'Expected 1 result, got {len(results)}'
         assert results[0][0] is True, f'Expected should_be_released=True, got {results[0][0]}'
 
-
-def read_mongo_data(json_file):
-    with open(json_file) as open_file:
-        json_data = json.load(open_file)
-    for document in json_data:
-        add_mongo_types(document)
-        if 'inactiveObjects' in document:
-            for sub_doc in document['inactiveObjects']:
-                add_mongo_types(sub_doc)
-    return json_data
-
-
-def add_mongo_types(json_dict):
-    for key in json_dict:
-        if key in ['start', 'rs', 'accession', 'mergeInto']:
-            json_dict[key] = Int64(json_dict[key])
-        if key in ['createdDate']:
-            json_dict[key] = datetime.strptime(json_dict[key], '%Y-%m-%dT%H:%M:%S.%fZ')
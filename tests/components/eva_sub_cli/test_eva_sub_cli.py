@@ -1,12 +1,14 @@
 import os
+from contextlib import nullcontext
 
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
 from ebi_eva_common_pyutils.logger import logging_config as log_cfg
 
 from tests.webin.webin_test_user import WebinTestUser
-from utils.docker_utils import copy_files_to_container
+from utils.connection_pool import metadata_connection
+from utils.docker_utils import run_command_in_container
 from utils.test_with_docker_compose import TestWithDockerCompose
+from utils.wait_utils import wait_for_rows
 
 logger = log_cfg.get_logger(__name__)
 
@@ -20,12 +22,11 @@ class TestEvaSubCli(TestWithDockerCompose):
     assembly_reports_dir = os.path.join(resources_directory, 'assembly_reports')
 
     test_run_dir = os.path.join(tests_directory, 'eva_sub_cli_test_run')
-    metadata_json = os.path.join(test_run_dir, 'metadata_json.json')
-    metadata_xlsx = os.path.join(test_run_dir, 'metadata_xlsx.xlsx')
 
     docker_compose_file = os.path.join(root_dir, 'components', 'docker-compose-eva-sub-cli.yml')
     container_name = 'eva_sub_cli_test'
     container_submission_dir = '/opt'
+    container_resources_dir = '/opt/tests/resources'
     submission_log_file = os.path.join(container_submission_dir, 'eva_submission.log')
     container_log_files = [
         (container_name, submission_log_file),
@@ -34,19 +35,33 @@ class TestEvaSubCli(TestWithDockerCompose):
 
     maven_settings_file = os.path.join(TestWithDockerCompose.root_dir, 'components', 'maven-settings.xml')
     maven_profile = 'localhost'
+    # The sub-cli stack does not include Mongo
+    mongo_container_name = None
+    notify_tables = ['eva_submissions.call_home_event']
 
     webin_test_user = WebinTestUser()
 
+    @property
+    def metadata_json(self):
+        return os.path.join(self.test_run_dir, 'metadata_json.json')
+
+    @property
+    def metadata_xlsx(self):
+        return os.path.join(self.test_run_dir, 'metadata_xlsx.xlsx')
+
     def setUp(self):
         super().setUp()
         # copy all required file into container
         self.create_submission_dir_and_copy_files_to_container()
 
     def create_submission_dir_and_copy_files_to_container(self):
-        for directory in [self.vcf_files_dir, self.fasta_files_dir, self.assembly_reports_dir]:
-            for file in os.listdir(directory):
-                file_path = os.path.join(directory, file)
-                copy_files_to_container(self.container_name, self.container_submission_dir, file_path)
+        # The test resources are mounted read-only in the container so they are copied within the container
+        container_resource_dirs = ' '.join(
+            os.path.join(self.container_resources_dir, os.path.basename(directory), '.')
+            for directory in [self.vcf_files_dir, self.fasta_files_dir, self.assembly_reports_dir]
+        )
+        run_command_in_container(self.container_name,
+                                 f'cp -r {container_resource_dirs} {self.container_submission_dir}/')
 
     def get_validation_json_metadata_existing_project(self, project_accession):
         json_metadata = self.get_validation_json_metadata()
@@ -130,9 +145,13 @@ class TestEvaSubCli(TestWithDockerCompose):
         }
 
     def assert_call_home_events_exist(self, expected_events=None, expected_tasks_list=None, expected_executors=None, metadata_connection_handle=None):
-        if not metadata_connection_handle:
-            metadata_connection_handle = get_metadata_connection_handle(self.maven_profile, self.maven_settings_file)
-        with metadata_connection_handle:
+        wait_for_rows(self.maven_profile, self.maven_settings_file, 'eva_submissions.call_home_event',
+                      min_count=len(expected_events) if expected_events else 1, timeout=self.wait_timeout)
+        if metadata_connection_handle:
+            connection_context = nullcontext(metadata_connection_handle)
+        else:
+            connection_context = metadata_connection(self.maven_profile, self.maven_settings_file)
+        with connection_context as metadata_connection_handle:
             call_home_query = (f"SELECT event_type, tasks, executor, raw_payload FROM eva_submissions.call_home_event")
             results = get_all_results_for_query(metadata_connection_handle, call_home_query)
             event_types = []
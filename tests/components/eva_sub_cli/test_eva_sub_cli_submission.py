@@ -4,16 +4,14 @@ import os
 import requests
 import yaml
 from ebi_eva_internal_pyutils.config_utils import get_properties_from_xml_file
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
-from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
 
 from tests.components.eva_sub_cli.test_eva_sub_cli import TestEvaSubCli
+from utils.connection_pool import metadata_connection
 from utils.docker_utils import copy_files_to_container, read_file_from_container
+from utils.expected_state import assert_expected_state
 from utils.test_utils import run_quiet_command
-from utils.test_with_docker_compose import TestWithDockerCompose, log_on_failure
+from utils.test_with_docker_compose import log_on_failure
 
-maven_settings_file = os.path.join(TestWithDockerCompose.root_dir, 'components', 'maven-settings.xml')
-maven_profile = 'localhost'
 
 class TestEvaSubCliSubmission(TestEvaSubCli):
 
@@ -147,36 +145,38 @@ class TestEvaSubCliSubmission(TestEvaSubCli):
         submission_account_id = f"{webin_account}_webin"
 
         # assert db details
-        with get_metadata_connection_handle(maven_profile, maven_settings_file) as metadata_connection_handle:
-            # assert submission account details
-            submission_account_query = f"SELECT id, user_id FROM eva_submissions.submission_account WHERE id='{submission_account_id}'"
-            for id, user_id in get_all_results_for_query(metadata_connection_handle, submission_account_query):
-                assert id == submission_account_id
-                assert user_id == webin_account
-
-            # assert submission details
-            submission_query = (f"SELECT submission_id,  status, submission_account_id "
-                                f"FROM eva_submissions.submission WHERE submission_id='{submission_id}'")
-            for id, status, submission_account in get_all_results_for_query(metadata_connection_handle,
-                                                                            submission_query):
-                assert id == submission_id
-                assert status == 'UPLOADED'
-                assert submission_account == submission_account_id
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+            assert_expected_state(metadata_connection_handle, [
+                # submission account details
+                {
+                    'table': 'eva_submissions.submission_account',
+                    'where': f"id='{submission_account_id}'",
+                    'rows': [{'id': submission_account_id, 'user_id': webin_account}]
+                },
+                # submission details
+                {
+                    'table': 'eva_submissions.submission',
+                    'where': f"submission_id='{submission_id}'",
+                    'rows': [{'submission_id': submission_id, 'status': 'UPLOADED',
+                              'submission_account_id': submission_account_id}]
+                },
+            ])
 
             self.assert_call_home_events_exist(expected_events= ['START', 'END'],
                                                expected_tasks_list=['submit', 'submit'],
                                                expected_executors=['native', 'native'])
         # assert details from webservice
 
+        profile_properties = get_properties_from_xml_file(self.maven_profile, self.maven_settings_file)
+        submission_ws_url = profile_properties['submission-ws.url']
+
         # assert submission status
-        response = requests.get(
-            f'http://localhost:8080/eva/webservices/submission-ws/v1/submission/{submission_id}/status')
+        response = requests.get(f'{submission_ws_url}/submission/{submission_id}/status')
         assert response.text == 'UPLOADED'
 
         # assert submission details
-        profile_properties = get_properties_from_xml_file(maven_profile, maven_settings_file)
         response = requests.get(
-            f'http://localhost:8080/eva/webservices/submission-ws/v1/admin/submission/{submission_id}',
+            f'{submission_ws_url}/admin/submission/{submission_id}',
             auth=(profile_properties['submission-ws.admin-user'], profile_properties['submission-ws.admin-password']))
         response_data = response.json()
         if existing_project:
@@ -205,12 +205,12 @@ class TestEvaSubCliSubmission(TestEvaSubCli):
                                                                             'lastName': 'test_user_last_name'}
 
         # assert emails sent for submission upload
-        mailhog_email_mgs_url = get_properties_from_xml_file(maven_profile, maven_settings_file)['mailhog.email-messages']
+        mailhog_email_mgs_url = get_properties_from_xml_file(self.maven_profile, self.maven_settings_file)['mailhog.email-messages']
         response = requests.get(mailhog_email_mgs_url)
         emails = response.json()
 
         # assert email sent to eva-helpdesk on submission upload
-        eva_helpdesk_email = get_properties_from_xml_file(maven_profile, maven_settings_file)['eva.helpdesk-email']
+        eva_helpdesk_email = get_properties_from_xml_file(self.maven_profile, self.maven_settings_file)['eva.helpdesk-email']
         mail_to_helpdesk = [email for email in emails
                             if eva_helpdesk_email in email['Content']['Headers'].get('To', [])
                             and 'eva-noreply@ebi.ac.uk' in email['Content']['Headers'].get('From', [])
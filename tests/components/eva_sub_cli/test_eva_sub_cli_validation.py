@@ -5,12 +5,19 @@ import shutil
 import yaml
 
 from tests.components.eva_sub_cli.test_eva_sub_cli import TestEvaSubCli
-from utils.docker_utils import copy_files_to_container, copy_files_from_container, read_file_from_container
+from utils.docker_utils import copy_files_to_container, download_files_from_container, read_file_from_container
 from utils.test_utils import run_quiet_command
 from utils.test_with_docker_compose import log_on_failure
 
 
 class TestEvaSubCliValidation(TestEvaSubCli):
+    # Directories of validation_output read by the assertions, the only ones downloaded from the container
+    validation_output_dirs = ['vcf_format', 'assembly_check', 'other_validations']
+
+    def download_validation_output(self):
+        download_files_from_container(self.container_name,
+                                      os.path.join(self.container_submission_dir, 'validation_output'),
+                                      self.test_run_dir, include=self.validation_output_dirs)
 
     @log_on_failure
     def test_native_validator_with_json(self):
@@ -29,10 +36,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         # Run validation from command line
         run_quiet_command("run eva_sub_cli native validator with json metadata using command line", validation_cmd)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -56,10 +61,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli native validator with xlsx metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -83,10 +86,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         # Run validation from command line
         run_quiet_command("run eva_sub_cli native validator with json metadata using command line", validation_cmd)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_partial_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json(),
                                                'Validation passed successfully.', self.get_expected_semantic_val())
@@ -109,10 +110,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli docker validator with json metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json_docker(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -136,10 +135,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli docker validator with json metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json_docker(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -163,10 +160,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli docker validator with json metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json_docker(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -190,10 +185,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli docker validator with xlsx metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json_docker(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -218,10 +211,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli docker validator with xlsx metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json_docker(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -246,10 +237,8 @@ class TestEvaSubCliValidation(TestEvaSubCli):
         run_quiet_command("run eva_sub_cli docker validator with xlsx metadata using command line",
                           validation_cmd, log_error_stream_to_output=True)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_submission_dir, 'validation_output'),
-                                  self.test_run_dir)
+        # download the validation reports from docker
+        self.download_validation_output()
         # assert results
         self.assert_validation_results(self.get_expected_sample(), self.get_expected_metadata_files_json_docker(),
                                        'Validation passed successfully.', self.get_expected_semantic_val(),
@@ -2,10 +2,10 @@ import json
 import os
 
 from ebi_eva_common_pyutils.config import Configuration
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import execute_query, get_all_results_for_query
 
-from utils.docker_utils import copy_files_to_container, run_docker_cmd, copy_files_from_container
+from utils.connection_pool import metadata_connection
+from utils.docker_utils import copy_files_to_container, run_docker_cmd
 from utils.test_utils import run_quiet_command
 from utils.test_with_docker_compose import TestWithDockerCompose, log_on_failure
 
@@ -24,6 +24,7 @@ class TestEvaSubmissionPreparation(TestWithDockerCompose):
     container_submission_dir = '/opt/ftp/private/eva-box-01/upload/username'
     container_submission_dir_json_webservice = f'/opt/ftp/private/eva-sub-cli/upload/{submission_account_id}/{submission_id}'
     container_eload_dir = '/opt/submissions'
+    container_dirs_to_reset = [container_eload_dir, container_submission_dir, '/opt/ftp/private/eva-sub-cli']
 
     def setUp(self):
         super().setUp()
@@ -44,7 +45,6 @@ class TestEvaSubmissionPreparation(TestWithDockerCompose):
         run_quiet_command("run eva_submission prepare_submission script for metadata spreadsheet", prepare_cmd)
 
         # assert submission id written to eload config and present in DB
-        copy_files_from_container(self.container_name, os.path.join(self.container_eload_dir), self.test_run_dir)
         eload_config_yml = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                         f'.ELOAD_{self.eload_number}_config.yml')
         assert os.path.isfile(eload_config_yml)
@@ -52,7 +52,7 @@ class TestEvaSubmissionPreparation(TestWithDockerCompose):
         assert config['submission']['submission_id'] is not None
         submission_id = config['submission']['submission_id']
 
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             query = (
                 f"select submission_id, eload, source from eva_submissions.submission_eload where eload = {self.eload_number}")
             results = get_all_results_for_query(metadata_connection_handle, query)
@@ -80,14 +80,13 @@ class TestEvaSubmissionPreparation(TestWithDockerCompose):
         run_quiet_command("run eva_submission prepare_submission script for metadata json from webservice", prepare_cmd)
 
         # assert submission id written to eload config
-        copy_files_from_container(self.container_name, os.path.join(self.container_eload_dir), self.test_run_dir)
         eload_config_yml = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                         f'.ELOAD_{self.eload_number}_config.yml')
         assert os.path.isfile(eload_config_yml)
         config = Configuration(eload_config_yml)
         assert config['submission']['submission_id'] == self.submission_id
 
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             query = (
                 f"select submission_id, eload, source from eva_submissions.submission_eload where eload = {self.eload_number}")
             results = get_all_results_for_query(metadata_connection_handle, query)
@@ -113,7 +112,7 @@ class TestEvaSubmissionPreparation(TestWithDockerCompose):
         copy_files_to_container(self.container_name, self.container_submission_dir_json_webservice, vcf_file)
 
         # insert data in eva-submission-ws tables
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             # insert submission account
             submission_account_query = (
                 f"INSERT INTO eva_submissions.submission_account (id, first_name, last_name, login_type, primary_email, user_id) "
@@ -3,10 +3,13 @@ import re
 import shutil
 
 from ebi_eva_common_pyutils.logger import logging_config as log_cfg
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
 
+from utils.connection_pool import metadata_connection
+from utils.docker_utils import run_command_in_container
+from utils.resource_sync import sync_files_to_container
 from utils.test_with_docker_compose import TestWithDockerCompose
+from utils.wait_utils import wait_for_rows
 
 logger = log_cfg.get_logger(__name__)
 
@@ -30,27 +33,53 @@ class TestEvaSubmission(TestWithDockerCompose):
     assembly_reports_dir = os.path.join(TestWithDockerCompose.resources_directory, 'assembly_reports')
 
     test_run_dir = os.path.join(TestWithDockerCompose.tests_directory, 'eva_submission_test_run')
-    metadata_xlsx = os.path.join(test_run_dir, 'metadata_xlsx.xlsx')
-    old_metadata_xlsx = os.path.join(test_run_dir, 'old_metadata_xlsx.xlsx')
-    metadata_json = os.path.join(test_run_dir, 'eva_sub_cli_metadata.json')
 
     docker_compose_file = os.path.join(TestWithDockerCompose.root_dir, 'components',
                                        'docker-compose-eva-submission.yml')
     container_name = 'eva_submission_test'
     container_reference_genome_dir = '/opt/reference_sequences/nitrospira/GCA_000002945.2'
     container_submission_dir = '/opt/ftp/private/eva-box-01/upload/username'
+    # container_eload_dir is bind mounted on test_run_dir so the ELOAD directories are read directly from the host
     container_eload_dir = '/opt/submissions'
+    container_dirs_to_reset = ['/opt/submissions', '/opt/no_backup/submissions', '/opt/ftp/public',
+                               container_submission_dir]
+    notify_tables = ['eva_submissions.submission_processing_status']
 
     maven_settings_file = os.path.join(TestWithDockerCompose.root_dir, 'components', 'maven-settings.xml')
     maven_profile = 'localhost'
 
+    @property
+    def metadata_xlsx(self):
+        return os.path.join(self.test_run_dir, 'metadata_xlsx.xlsx')
+
+    @property
+    def old_metadata_xlsx(self):
+        return os.path.join(self.test_run_dir, 'old_metadata_xlsx.xlsx')
+
+    @property
+    def metadata_json(self):
+        return os.path.join(self.test_run_dir, 'eva_sub_cli_metadata.json')
+
     def setUp(self):
         super().setUp()
+        # /opt/ftp is bind mounted on an empty host directory
+        run_command_in_container(self.container_name, f'mkdir -p {self.container_submission_dir}')
         self.container_log_files = []
 
+    def copy_reference_genome(self):
+        # Only copied when the container does not already hold the same files
+        sync_files_to_container(self.container_name, {
+            os.path.join(self.assembly_reports_dir, 'GCA_000002945.2_assembly_report.txt'):
+                os.path.join(self.container_reference_genome_dir, 'GCA_000002945.2_assembly_report.txt'),
+            os.path.join(self.fasta_files_dir, 'GCA_000002945.2.fa'):
+                os.path.join(self.container_reference_genome_dir, 'GCA_000002945.2.fa'),
+        })
+
     def assert_submission_processing_status_updated(self, submission_id, step, status):
-        metadata_connection_handle = get_metadata_connection_handle(self.maven_profile, self.maven_settings_file)
-        with metadata_connection_handle:
+        wait_for_rows(self.maven_profile, self.maven_settings_file, 'eva_submissions.submission_processing_status',
+                      f"submission_id = '{submission_id}' and step = '{step}' and status = '{status}'",
+                      timeout=self.wait_timeout)
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             submission_status_query = (f"SELECT status FROM eva_submissions.submission_processing_status "
                                        f"where submission_id = '{submission_id}' and step = '{step}'")
             results = get_all_results_for_query(metadata_connection_handle, submission_status_query)
@@ -5,12 +5,11 @@ import subprocess
 
 import yaml
 from ebi_eva_common_pyutils.config import Configuration
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
 
 from tests.components.eva_submission.test_eva_submission import TestEvaSubmission
-from utils.docker_utils import copy_files_to_container, copy_files_from_container, read_file_from_container
-from utils.test_utils import run_quiet_command
+from utils.connection_pool import metadata_connection
+from utils.docker_utils import copy_files_to_container, read_file_from_container, run_command_in_container
 from utils.test_with_docker_compose import log_on_failure
 
 
@@ -52,30 +51,25 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
     @log_on_failure
     def test_submission_with_new_metadata_spreadsheet(self):
         prepare_cmd = (
-            f"docker exec {self.container_name} prepare_submission.py --submitter username --ftp_box 1 --eload {self.eload_number1}"
+            f"prepare_submission.py --submitter username --ftp_box 1 --eload {self.eload_number1}"
         )
 
         # Run preparation from command line
-        run_quiet_command("run eva_submission prepare_submission script", prepare_cmd)
+        self.stream_command_in_container(prepare_cmd)
 
         validation_cmd = (
-            f"docker exec {self.container_name} sh -c 'validate_submission.py --eload {self.eload_number1} > {self.container_eload_dir}/ELOAD_{self.eload_number1}/validation.out 2>&1'"
+            f"validate_submission.py --eload {self.eload_number1} > {self.container_eload_dir}/ELOAD_{self.eload_number1}/validation.out 2>&1"
         )
         # Run validation from command line
-        run_quiet_command("run eva_submission validate_submission script", validation_cmd)
+        run_command_in_container(self.container_name, validation_cmd, timeout=self.command_timeout)
 
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number1}/broker.out'
         self.container_log_files.append((self.container_name, log_file))
         brokering_cmd = (
-            f"docker exec {self.container_name} sh -c 'broker_submission.py --use_legacy_upload --debug --eload {self.eload_number1} > {log_file} 2>&1'"
+            f"broker_submission.py --use_legacy_upload --debug --eload {self.eload_number1} > {log_file} 2>&1"
         )
         # Run brokering from command line
-        run_quiet_command("run eva_submission broker_submission script", brokering_cmd)
-
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_eload_dir),
-                                  self.test_run_dir)
+        run_command_in_container(self.container_name, brokering_cmd, timeout=self.command_timeout)
 
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number1}',
@@ -93,15 +87,10 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number2}/broker.out'
         self.container_log_files.append((self.container_name, log_file))
         brokering_cmd = (
-            f"docker exec {self.container_name} sh -c 'broker_submission.py --use_legacy_upload --debug --eload {self.eload_number2} > {log_file} 2>&1'"
+            f"broker_submission.py --use_legacy_upload --debug --eload {self.eload_number2} > {log_file} 2>&1"
         )
         # Run brokering from command line
-        run_quiet_command("run eva_submission broker_submission script", brokering_cmd)
-
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_eload_dir),
-                                  self.test_run_dir)
+        run_command_in_container(self.container_name, brokering_cmd, timeout=self.command_timeout)
 
         # assert results
         self.assert_brokering_pass_in_config(
@@ -112,15 +101,10 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number3}/broker.out'
         self.container_log_files.append((self.container_name, log_file))
         brokering_cmd = (
-            f"docker exec {self.container_name} sh -c 'broker_submission.py --use_legacy_upload --debug --eload {self.eload_number3} --project_accession PRJEB12770 > {log_file} 2>&1'"
+            f"broker_submission.py --use_legacy_upload --debug --eload {self.eload_number3} --project_accession PRJEB12770 > {log_file} 2>&1"
         )
         # Run brokering from command line
-        run_quiet_command("run eva_submission broker_submission script", brokering_cmd)
-
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_eload_dir),
-                                  self.test_run_dir)
+        run_command_in_container(self.container_name, brokering_cmd, timeout=self.command_timeout)
 
         # assert results
         self.assert_brokering_pass_in_config(
@@ -129,30 +113,25 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
     @log_on_failure
     def test_submission_with_ena_xml(self):
         prepare_cmd = (
-            f"docker exec {self.container_name} prepare_submission.py --submitter username --ftp_box 1 --eload {self.eload_number4}"
+            f"prepare_submission.py --submitter username --ftp_box 1 --eload {self.eload_number4}"
         )
 
         # Run preparation from command line
-        run_quiet_command("run eva_submission prepare_submission script", prepare_cmd)
+        self.stream_command_in_container(prepare_cmd)
 
         validation_cmd = (
-            f"docker exec {self.container_name} sh -c 'validate_submission.py --eload {self.eload_number4} > {self.container_eload_dir}/ELOAD_{self.eload_number4}/validation.out 2>&1'"
+            f"validate_submission.py --eload {self.eload_number4} > {self.container_eload_dir}/ELOAD_{self.eload_number4}/validation.out 2>&1"
         )
         # Run validation from command line
-        run_quiet_command("run eva_submission validate_submission script", validation_cmd)
+        run_command_in_container(self.container_name, validation_cmd, timeout=self.command_timeout)
 
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number4}/broker.out'
         self.container_log_files.append((self.container_name, log_file))
         brokering_cmd = (
-            f"docker exec {self.container_name} sh -c 'broker_submission.py --use_legacy_upload --debug --eload {self.eload_number4} --output_format xml > {log_file} 2>&1'"
+            f"broker_submission.py --use_legacy_upload --debug --eload {self.eload_number4} --output_format xml > {log_file} 2>&1"
         )
         # Run brokering from command line
-        run_quiet_command("run eva_submission broker_submission script", brokering_cmd)
-
-        # copy validation output from docker
-        copy_files_from_container(self.container_name,
-                                  os.path.join(self.container_eload_dir),
-                                  self.test_run_dir)
+        run_command_in_container(self.container_name, brokering_cmd, timeout=self.command_timeout)
 
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number4}',
@@ -169,13 +148,13 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
     def test_brokering_crash_records_status(self):
         # Run prepare and validate
         prepare_cmd = (
-            f"docker exec {self.container_name} prepare_submission.py --submitter username --ftp_box 1 --eload {self.eload_number5}"
+            f"prepare_submission.py --submitter username --ftp_box 1 --eload {self.eload_number5}"
         )
-        run_quiet_command("run eva_submission prepare_submission script", prepare_cmd)
+        self.stream_command_in_container(prepare_cmd)
         validation_cmd = (
-            f"docker exec {self.container_name} sh -c 'validate_submission.py --eload {self.eload_number5} > {self.container_eload_dir}/ELOAD_{self.eload_number5}/validation.out 2>&1'"
+            f"validate_submission.py --eload {self.eload_number5} > {self.container_eload_dir}/ELOAD_{self.eload_number5}/validation.out 2>&1"
         )
-        run_quiet_command("run eva_submission validate_submission script", validation_cmd)
+        run_command_in_container(self.container_name, validation_cmd, timeout=self.command_timeout)
 
         # Overwrite Webin credentials with incorrect ones
         yaml_content = read_file_from_container(self.container_name,
@@ -193,16 +172,13 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number5}/broker.out'
         self.container_log_files.append((self.container_name, log_file))
         brokering_cmd = (
-            f"docker exec {self.container_name} sh -c 'broker_submission.py --use_legacy_upload --debug --eload {self.eload_number5} --output_format xml > {log_file} 2>&1'"
+            f"broker_submission.py --use_legacy_upload --debug --eload {self.eload_number5} --output_format xml > {log_file} 2>&1"
         )
         try:
-            run_quiet_command("run eva_submission broker_submission script", brokering_cmd)
+            run_command_in_container(self.container_name, brokering_cmd, timeout=self.command_timeout)
             # command should crash so we don't get here
             assert False
         except subprocess.CalledProcessError:
-            copy_files_from_container(self.container_name,
-                                      os.path.join(self.container_eload_dir),
-                                      self.test_run_dir)
             eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number5}',
                                              f'.ELOAD_{self.eload_number5}_config.yml')
             config = Configuration(eload_config_file)
@@ -226,10 +202,7 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
         os.remove(tmp_yml)
 
         # Prepare reference genome
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.assembly_reports_dir, 'GCA_000002945.2_assembly_report.txt'))
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.fasta_files_dir, 'GCA_000002945.2.fa'))
+        self.copy_reference_genome()
 
         vcf_file = os.path.join(self.vcf_files_dir, 'vcf_file_ASM294v2.vcf')
         copy_files_to_container(self.container_name, self.container_submission_dir, vcf_file)
@@ -278,8 +251,7 @@ class TestEvaSubmissionBrokering(TestEvaSubmission):
         assert config.query('brokering', 'ena', 'PROJECT', ret_default='').startswith('PRJE')
 
     def assert_submission_details_updated(self, submission_id):
-        metadata_connection_handle = get_metadata_connection_handle(self.maven_profile, self.maven_settings_file)
-        with metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             submission_details_query = (f"SELECT release_date, project_accession "
                                         f"FROM eva_submissions.submission_tracking_details "
                                         f"where submission_id = '{submission_id}'")
@@ -1,13 +1,11 @@
 import os
-from datetime import datetime, timezone
 
-from bson import Int64
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
-from ebi_eva_internal_pyutils.mongo_utils import get_mongo_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query, execute_query
-from pymongo.errors import BulkWriteError
 
+from utils.connection_pool import metadata_connection, mongo_connection
 from utils.docker_utils import copy_files_to_container, run_command_in_container
+from utils.fixture_utils import load_fixture
+from utils.mongo_verifier import assert_mongo_state
 from utils.test_utils import run_quiet_command
 from utils.test_with_docker_compose import TestWithDockerCompose, log_on_failure
 
@@ -16,8 +14,11 @@ class TestEvaSubmissionDeprecation(TestWithDockerCompose):
     docker_compose_file = os.path.join(TestWithDockerCompose.root_dir, 'components',
                                        'docker-compose-eva-submission.yml')
     container_name = 'eva_submission_test'
+    # Only needs Postgres and Mongo besides the submission container
+    compose_services = ['eva_submission']
     container_eload_dir = '/opt/submissions'
     container_output_dir = '/opt/deprecation_output'
+    container_dirs_to_reset = [container_eload_dir, container_output_dir]
 
     test_run_dir = os.path.join(TestWithDockerCompose.tests_directory, 'eva_deprecation_test_run')
     maven_settings_file = os.path.join(TestWithDockerCompose.root_dir, 'components', 'maven-settings.xml')
@@ -33,155 +34,17 @@ class TestEvaSubmissionDeprecation(TestWithDockerCompose):
 
     def setUp(self):
         super().setUp()
-        self._seed_evapro()
-        self._seed_mongodb()
+        self._seed_databases()
         self._create_accession_report()
         self.container_log_files = []
         run_command_in_container(self.container_name, f'mkdir -p {self.container_output_dir}')
 
-    def _seed_evapro(self):
-        """Insert the minimal EVAPRO rows needed to deprecate PRJEB12345."""
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as conn:
-            execute_query(conn,
-                "INSERT INTO evapro.taxonomy (taxonomy_id, common_name, scientific_name, taxonomy_code, eva_name) "
-                "VALUES (3847, 'Soybean', 'Glycine max', 'gmax', 'Soybean') "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.assembly_set (taxonomy_id, assembly_name, assembly_code) "
-                "VALUES (3847, 'Glycine_max_v2.0', 'glycine_max_v2') "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.accessioned_assembly "
-                "(assembly_set_id, assembly_accession, assembly_chain, assembly_version) "
-                "SELECT assembly_set_id, 'GCA_000004515.4', 'GCA_000004515', 4 "
-                "FROM evapro.assembly_set WHERE assembly_code = 'glycine_max_v2' "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.eva_submission (eva_submission_id, eva_submission_status_id) "
-                "VALUES (1, 6) "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.project "
-                "(project_accession, center_name, alias, title, description, scope, material, type, "
-                "ena_status, eva_status) "
-                "VALUES ('PRJEB12345', 'Test Centre', 'ELOAD_1', 'Test Study', 'Test description', "
-                "'Multi-isolate', 'DNA', 'Study', 4, 1) "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.project_taxonomy (project_accession, taxonomy_id) "
-                "VALUES ('PRJEB12345', 3847) "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.analysis "
-                "(analysis_accession, title, alias, vcf_reference_accession, hidden_in_eva, assembly_set_id) "
-                "SELECT 'ERZ99999', 'Test Analysis', 'test_analysis', 'GCA_000004515.4', 0, assembly_set_id "
-                "FROM evapro.assembly_set WHERE assembly_code = 'glycine_max_v2' "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.project_analysis (project_accession, analysis_accession) "
-                "VALUES ('PRJEB12345', 'ERZ99999') "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.project_eva_submission (project_accession, old_ticket_id, eload_id) "
-                "VALUES ('PRJEB12345', 1, 1) "
-                "ON CONFLICT DO NOTHING"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.file "
-                "(filename, file_md5, file_type, file_class, file_version, is_current) "
-                "VALUES ('test_sample.vcf.gz', 'abc123', 'VCF', 'submitted', 1, 1)"
-            )
-            execute_query(conn,
-                "INSERT INTO evapro.analysis_file (analysis_accession, file_id) "
-                "SELECT 'ERZ99999', file_id FROM evapro.file WHERE filename = 'test_sample.vcf.gz' "
-                "ON CONFLICT DO NOTHING"
-            )
+    def _seed_databases(self):
+        """Load the minimal EVAPRO rows and Mongo documents needed to deprecate PRJEB12345."""
+        load_fixture('deprecation.yml', self.maven_profile, self.maven_settings_file)
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as conn:
             execute_query(conn, "REFRESH MATERIALIZED VIEW evapro.study_browser")
 
-    @staticmethod
-    def _insert_many_ignore_duplicates(collection, documents):
-        """Insert documents into a collection, ignoring duplicate key errors."""
-        try:
-            collection.insert_many(documents, ordered=False)
-        except BulkWriteError as e:
-            if any(err['code'] != 11000 for err in e.details.get('writeErrors', [])):
-                raise
-
-    def _seed_mongodb(self):
-        """Insert MongoDB documents needed by deprecation tests."""
-        created_date = datetime(2021, 4, 28, 16, 32, 11, 168000, tzinfo=timezone.utc)
-        with get_mongo_connection_handle(self.maven_profile, self.maven_settings_file) as mongo_conn:
-            self._insert_many_ignore_duplicates(
-                mongo_conn['eva_accession_sharded']['submittedVariantEntity'],
-                [
-                    {
-                        '_id': 'A1B2C3D4E5F6A1B2C3D4E5F6A1B2C3D4E5F6A1B2',
-                        'seq': 'GCA_000004515.4', 'tax': 3847, 'study': 'PRJEB12345',
-                        'contig': 'CM000834.3', 'start': Int64(315),
-                        'ref': 'G', 'alt': 'C',
-                        'accession': Int64(5000000001), 'version': 1, 'createdDate': created_date
-                    },
-                    {
-                        '_id': 'B2C3D4E5F6A1B2C3D4E5F6A1B2C3D4E5F6A1B2C3',
-                        'seq': 'GCA_000004515.4', 'tax': 3847, 'study': 'PRJEB12345',
-                        'contig': 'CM000834.3', 'start': Int64(420),
-                        'ref': 'A', 'alt': 'T',
-                        'accession': Int64(5000000002), 'version': 1, 'createdDate': created_date
-                    },
-                    {
-                        '_id': 'C3D4E5F6A1B2C3D4E5F6A1B2C3D4E5F6A1B2C3D4',
-                        'seq': 'GCA_000004515.4', 'tax': 3847, 'study': 'PRJEB12345',
-                        'contig': 'CM000834.3', 'start': Int64(530),
-                        'ref': 'T', 'alt': 'C',
-                        'accession': Int64(5000000003), 'version': 1, 'createdDate': created_date
-                    },
-                ]
-            )
-            variant_db = mongo_conn['eva_gmax_glycine_max_v2']
-            self._insert_many_ignore_duplicates(
-                variant_db['variants_2_0'],
-                [
-                    {
-                        '_id': 'CM000834.3_315_G_C',
-                        'chr': 'CM000834.3', 'start': 315,
-                        '_at': {'chunkIds': ['CM000834.3_0_1k', 'CM000834.3_0_10k']},
-                        'alt': 'C', 'end': 315,
-                        'files': [{
-                            'fid': 'ERZ99999', 'sid': 'PRJEB12345',
-                            'attrs': {'QUAL': '100', 'AC': '1', 'AF': '0.5', 'AN': '2'},
-                            'fm': 'GT', 'samp': {'def': '0/1'}
-                        }],
-                        'hgvs': [{'type': 'genomic', 'name': 'CM000834.3:g.315G>C'}],
-                        'len': 1, 'ref': 'G', 'type': 'SNV', 'annot': []
-                    },
-                    {
-                        '_id': 'CM000834.3_420_A_T',
-                        'chr': 'CM000834.3', 'start': 420,
-                        '_at': {'chunkIds': ['CM000834.3_0_1k', 'CM000834.3_0_10k']},
-                        'alt': 'T', 'end': 420,
-                        'files': [{
-                            'fid': 'ERZ99999', 'sid': 'PRJEB12345',
-                            'attrs': {'QUAL': '100', 'AC': '1', 'AF': '0.5', 'AN': '2'},
-                            'fm': 'GT', 'samp': {'def': '0/1'}
-                        }],
-                        'hgvs': [{'type': 'genomic', 'name': 'CM000834.3:g.420A>T'}],
-                        'len': 1, 'ref': 'A', 'type': 'SNV', 'annot': []
-                    },
-                ]
-            )
-            self._insert_many_ignore_duplicates(
-                variant_db['files_2_0'],
-                [{'sid': 'PRJEB12345', 'fid': 'ERZ99999', 'fname': 'test_sample.vcf.gz'}]
-            )
-
     def _create_accession_report(self):
         """Write a minimal accessioned VCF to test_run_dir, copy to container, bgzip."""
         local_vcf = os.path.join(self.test_run_dir, 'test_sample.accessioned.vcf')
@@ -219,7 +82,7 @@ class TestEvaSubmissionDeprecation(TestWithDockerCompose):
     def test_deprecate_mark_inactive(self):
         self._run_deprecate('mark_inactive')
 
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as conn:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as conn:
             # project.eva_status should be 0 (inactive)
             results = get_all_results_for_query(
                 conn, "SELECT eva_status FROM evapro.project WHERE project_accession = 'PRJEB12345'"
@@ -258,15 +121,17 @@ class TestEvaSubmissionDeprecation(TestWithDockerCompose):
         self._run_deprecate('deprecate_variants', extra_args=assemblies_arg)
 
         # Verify all 3 submittedVariantEntity documents are deprecated
-        with get_mongo_connection_handle(self.maven_profile, self.maven_settings_file) as mongo_conn:
-            count = mongo_conn['eva_accession_sharded']['submittedVariantEntity'].count_documents(
-                {'study': self.project_accession, 'seq': self.assembly_accession}
-            )
-            assert count == 0
-            count = mongo_conn['eva_accession_sharded']['submittedVariantOperationEntity'].count_documents(
-                {'inactiveObjects.study': self.project_accession, 'inactiveObjects.seq': self.assembly_accession}
-            )
-            assert count == 3
+        with mongo_connection(self.maven_profile, self.maven_settings_file) as mongo_conn:
+            assert_mongo_state(mongo_conn, {
+                'eva_accession_sharded.submittedVariantEntity': {
+                    'counts': [{'filter': {'study': self.project_accession, 'seq': self.assembly_accession},
+                                'count': 0}]
+                },
+                'eva_accession_sharded.submittedVariantOperationEntity': {
+                    'counts': [{'filter': {'inactiveObjects.study': self.project_accession,
+                                           'inactiveObjects.seq': self.assembly_accession}, 'count': 3}]
+                },
+            })
 
     @log_on_failure
     def test_deprecate_drop_study(self):
@@ -282,11 +147,8 @@ class TestEvaSubmissionDeprecation(TestWithDockerCompose):
         self._run_deprecate('drop_study', extra_args=assemblies_arg)
 
         # Verify variants_2_0 and files_2_0 no longer has PRJEB12345
-        with get_mongo_connection_handle(self.maven_profile, self.maven_settings_file) as mongo_conn:
-            variant_db = mongo_conn[db_name]
-            variants_count = variant_db['variants_2_0'].count_documents({'files.sid': 'PRJEB12345'})
-            files_count = variant_db['files_2_0'].count_documents({'sid': 'PRJEB12345'})
-        assert variants_count == 0, \
-            f"Expected 0 variants for PRJEB12345 in variants_2_0, got: {variants_count}"
-        assert files_count == 0, \
-            f"Expected 0 files for PRJEB12345 in files_2_0, got: {files_count}"
+        with mongo_connection(self.maven_profile, self.maven_settings_file) as mongo_conn:
+            assert_mongo_state(mongo_conn, {
+                f'{db_name}.variants_2_0': {'counts': [{'filter': {'files.sid': 'PRJEB12345'}, 'count': 0}]},
+                f'{db_name}.files_2_0': {'counts': [{'filter': {'sid': 'PRJEB12345'}, 'count': 0}]},
+            })
@@ -4,15 +4,18 @@ import subprocess
 
 import yaml
 from ebi_eva_common_pyutils.config import Configuration
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
-from ebi_eva_internal_pyutils.mongo_utils import get_mongo_connection_handle
-from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query, execute_query
+from ebi_eva_internal_pyutils.pg_utils import execute_query
 
 from tests.components.eva_submission.test_eva_submission import TestEvaSubmission, extract_nextflow_work_dirs_from_log
-from utils.docker_utils import copy_files_to_container, copy_files_from_container, read_file_from_container, \
-    run_command_in_container
-from utils.test_utils import run_quiet_command
+from utils.connection_pool import metadata_connection, mongo_connection
+from utils.docker_utils import copy_files_to_container, read_file_from_container, run_command_in_container
+from utils.expected_state import assert_expected_state, load_expected_state
+from utils.mongo_verifier import assert_mongo_state
+from utils.resource_sync import copy_derived_files_to_container
+from utils.setup_executor import run_setup_steps
 from utils.test_with_docker_compose import log_on_failure
+from utils.vcf_verifier import assert_vcf
+from utils.wait_utils import wait_for_documents
 
 
 class TestEvaSubmissionIngestion(TestEvaSubmission):
@@ -48,13 +51,10 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number}/ingestion.out'
         self.container_log_files.append((self.container_name, log_file))
         ingestion_cmd = (
-            f"docker exec {self.container_name} sh -c 'ingest_submission.py --eload {self.eload_number} --tasks archive_only > {log_file} 2>&1'"
+            f"ingest_submission.py --eload {self.eload_number} --tasks archive_only > {log_file} 2>&1"
         )
         # Run ingestion from command line
-        run_quiet_command("run eva_submission ingest_submission script for archive_only", ingestion_cmd)
-
-        # copy validation output from docker
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
+        run_command_in_container(self.container_name, ingestion_cmd, timeout=self.command_timeout)
 
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}', f'.ELOAD_{self.eload_number}_config.yml')
@@ -74,22 +74,19 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         log_file1 = f'{self.container_eload_dir}/ELOAD_{self.eload_number}/ingestion_first.out'
         self.container_log_files.append((self.container_name, log_file1))
         ingestion_cmd = (
-            f"docker exec {self.container_name} sh -c 'ingest_submission.py --eload {self.eload_number} --tasks metadata_load variant_load accession > {log_file1} '"
+            f"ingest_submission.py --eload {self.eload_number} --tasks metadata_load variant_load accession > {log_file1} "
         )
         # Run ingestion from command line
-        run_quiet_command("run eva_submission ingest_submission script for variant_load and accession", ingestion_cmd)
+        run_command_in_container(self.container_name, ingestion_cmd, timeout=self.command_timeout)
 
         log_file2 = f'{self.container_eload_dir}/ELOAD_{self.eload_number}/ingestion_second.out'
         self.container_log_files.append((self.container_name, log_file2))
         # Run a second time but only the variant load
         ingestion_cmd = (
-            f"docker exec {self.container_name} sh -c 'ingest_submission.py --eload {self.eload_number} --tasks variant_load > {log_file2} 2>&1'"
+            f"ingest_submission.py --eload {self.eload_number} --tasks variant_load > {log_file2} 2>&1"
         )
         # Run ingestion from command line
-        run_quiet_command("run eva_submission ingest_submission script for variant_load and accession", ingestion_cmd)
-
-        # copy validation output from docker
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
+        run_command_in_container(self.container_name, ingestion_cmd, timeout=self.command_timeout)
 
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
@@ -129,14 +126,13 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         log_file = f'{self.container_eload_dir}/ELOAD_{self.eload_number}/ingestion.out'
         self.container_log_files.append((self.container_name, log_file))
         ingestion_cmd = (
-            f"docker exec {self.container_name} sh -c 'ingest_submission.py --eload {self.eload_number} > {log_file} 2>&1'"
+            f"ingest_submission.py --eload {self.eload_number} > {log_file} 2>&1"
         )
         try:
-            run_quiet_command("run eva_submission ingest_submission script that is meant to fail", ingestion_cmd)
+            run_command_in_container(self.container_name, ingestion_cmd, timeout=self.command_timeout)
             # command should crash so we don't get here
             assert False
         except subprocess.CalledProcessError:
-            copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
             # assert results
             eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}', f'.ELOAD_{self.eload_number}_config.yml')
             config = Configuration(eload_config_file)
@@ -145,12 +141,15 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
             self.assert_submission_processing_status_updated(submission_id, 'INGESTION', 'FAILURE')
 
     def create_submission_dir_and_copy_files_to_container(self):
-        # Prepare reference genome
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.assembly_reports_dir, 'GCA_000002945.2_assembly_report.txt'))
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.fasta_files_dir, 'GCA_000002945.2.fa'))
-
+        run_setup_steps({
+            'copy_reference_genome': (self.copy_reference_genome, []),
+            'copy_eload_config': (self._copy_eload_config, []),
+            'copy_compressed_vcf': (self._copy_compressed_vcf, []),
+            'make_public_ftp_dir': (self._make_public_ftp_dir, []),
+            'insert_submission': (self._insert_submission, []),
+        })
+
+    def _copy_eload_config(self):
         # prepare eload folder with eload config file
         eload_config_template = os.path.join(self.resources_directory, 'ELOAD_configs',
                                              '.ELOAD_number_post_brokering.yml')
@@ -162,19 +161,23 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         eload_dir = os.path.join(self.container_eload_dir, f'ELOAD_{self.eload_number}')
         copy_files_to_container(self.container_name, eload_dir, eload_config_file)
 
+    def _copy_compressed_vcf(self):
         # compress and index the vcf file and put in 18_brokering
-        copy_files_to_container(self.container_name, os.path.join(eload_dir, '18_brokering', 'ena'), self.vcf_file)
-        vcf_file_in_container = os.path.join(eload_dir, '18_brokering', 'ena', self.vcf_file_name)
-        run_command_in_container(self.container_name, f"bgzip -f {vcf_file_in_container}")
-        run_command_in_container(self.container_name, f"bcftools index -c {vcf_file_in_container}.gz")
+        copy_derived_files_to_container(
+            self.container_name, self.vcf_file,
+            os.path.join(self.container_eload_dir, f'ELOAD_{self.eload_number}', '18_brokering', 'ena'),
+            [f'{self.vcf_file_name}.gz', f'{self.vcf_file_name}.gz.csi'],
+            f'bgzip -f {self.vcf_file_name} && bcftools index -c {self.vcf_file_name}.gz'
+        )
 
-        # make public ftp directory
+    def _make_public_ftp_dir(self):
         yaml_content = read_file_from_container(self.container_name, os.path.join('/root', '.submission_config.yml'))
         submission_config = yaml.safe_load(yaml_content)
         run_command_in_container(self.container_name, f"mkdir -p {submission_config['public_ftp_dir']}")
 
+    def _insert_submission(self):
         # insert data in eva-submission-ws tables
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             # insert submission account
             submission_account_query = (
                 f"INSERT INTO eva_submissions.submission_account (id, first_name, last_name, login_type, primary_email, user_id) "
@@ -248,6 +251,12 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         assert os.path.isfile(os.path.join(eva_60_public_dir, index_vcf_file))
         assert os.path.isfile(os.path.join(eva_60_public_dir, accessioned_vcf_file))
         assert os.path.isfile(os.path.join(eva_60_public_dir, accessioned_index_file))
+        # The accessioned VCF holds the variants of the submitted VCF, whatever the naming of their contigs
+        with open(self.vcf_file) as open_file:
+            submitted_records = [line for line in open_file if not line.startswith('#')]
+        assert_vcf(os.path.join(eva_60_public_dir, accessioned_vcf_file),
+                   assembly_report=os.path.join(self.assembly_reports_dir, 'GCA_000002945.2_assembly_report.txt'),
+                   expected_record_count=len(submitted_records), expected_records=submitted_records)
 
         # assert files copied to public ftp
         public_ftp_dir = self.get_public_ftp_dir()
@@ -260,10 +269,8 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         self.assert_data_loaded_to_mongodb()
 
     def assert_file_copied_to_public_ftp(self, public_ftp_dir, file):
-        file_path = os.path.join(public_ftp_dir, file)
-        run_quiet_command("run copy command to copy from public ftp",
-                          f"docker cp {self.container_name}:{file_path} {self.test_run_dir}")
-        assert os.path.isfile(os.path.join(self.test_run_dir, file))
+        # /opt/ftp is bind mounted so the public FTP is checked on the host
+        assert os.path.isfile(self.get_host_path(os.path.join(public_ftp_dir, file)))
 
     def get_public_ftp_dir(self):
         yaml_content_submission_config = read_file_from_container(self.container_name,
@@ -278,167 +285,39 @@ class TestEvaSubmissionIngestion(TestEvaSubmission):
         return public_ftp_dir
 
     def assert_data_from_ena_loaded_to_evapro(self):
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
-            query = ("select project_accession, taxonomy_id from evapro.project_taxonomy "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 4530)]
-            assert set(results) == set(expected)
-
-            query = ("select eva_submission_id, eva_submission_status_id from evapro.eva_submission "
-                     "where eva_submission_id = 1513")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1513, 6)]
-            assert set(results) == set(expected)
-
-            query = ("select project_accession, old_ticket_id, eload_id from evapro.project_eva_submission "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 1513, 1513)]
-            assert set(results) == set(expected)
-
-            query = "select project_accession, alias from evapro.project where project_accession = 'PRJEB105137'"
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 'ELOAD_1513')]
-            assert set(results) == set(expected)
-
-            query = ("select project_accession, submission_id from evapro.project_ena_submission "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 1)]
-            assert set(results) == set(expected)
-
-            query = ("select taxonomy_id, common_name, scientific_name, taxonomy_code, eva_name from evapro.taxonomy "
-                     "where taxonomy_id=4530")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(4530, 'Asian cultivated rice', 'Oryza sativa', 'osativa', 'Asian cultivated rice')]
-            assert set(results) == set(expected)
-
-            query = ("select submission_id, submission_accession, type from evapro.submission "
-                     "where submission_accession = 'ERA35393650'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1, 'ERA35393650', 'PROJECT')]
-            assert set(results) == set(expected)
-
-            query = ("select assembly_set_id, taxonomy_id, assembly_name, assembly_code from evapro.assembly_set "
-                     "where taxonomy_id = 4530")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1, 4530, 'IRGSP-1.0', 'irgsp10')]
-            assert set(results) == set(expected)
-
-            query = ("select assembly_set_id, assembly_accession, assembly_chain, assembly_version from evapro.accessioned_assembly "
-                     "where assembly_accession = 'GCA_001433935.1'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1, 'GCA_001433935.1', 'GCA_001433935', 1)]
-            assert set(results) == set(expected)
-
-            query = ("select analysis_accession, vcf_reference_accession, assembly_set_id from evapro.analysis "
-                     "where analysis_accession = 'ERZ28769990'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('ERZ28769990', 'GCA_001433935.1', 1)]
-            assert set(results) == set(expected)
-
-            query = ("select project_accession, analysis_accession from evapro.project_analysis "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 'ERZ28769990')]
-            assert set(results) == set(expected)
-
-            query = "select experiment_type_id, experiment_type from evapro.experiment_type"
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1, 'Whole genome sequencing')]
-            assert set(results) == set(expected)
-
-            query = ("select analysis_accession, submission_id from evapro.analysis_submission "
-                     "where analysis_accession = 'ERZ28769990'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('ERZ28769990', 1)]
-            assert set(results) == set(expected)
-
-            query = ("select analysis_accession, experiment_type_id from evapro.analysis_experiment_type "
-                     "where analysis_accession = 'ERZ28769990'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('ERZ28769990', 1)]
-            assert set(results) == set(expected)
-
-            query = "select analysis_accession, file_id from evapro.analysis_file where analysis_accession = 'ERZ28769990'"
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('ERZ28769990', 1), ('ERZ28769990', 2)]
-            assert set(results) == set(expected)
-
-            query = ("select project_accession, sample_count, pro_samp1_id from evapro.project_samples_temp1 "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 0, 43)]
-            assert set(results) == set(expected)
-
-            query = ("select project_accession, taxonomy_ids from evapro.project_children_taxonomy "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', '4530')]
-            assert set(results) == set(expected)
-
-            query = ("select project_accession, reference_accession from evapro.project_reference "
-                     "where project_accession = 'PRJEB105137'")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [('PRJEB105137', 'GCA_001433935.1')]
-            assert set(results) == set(expected)
-
-            query = ("select sample_id, biosample_accession, ena_accession from evapro.sample "
-                     "where biosample_accession in ('SAMD00045866', 'SAMD00045867', 'SAMD00045868', 'SAMD00045869', 'SAMD00045870')")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1, 'SAMD00045866', 'DRS029882'), (2, 'SAMD00045867', 'DRS029883'),
-                        (3, 'SAMD00045868', 'DRS029884'), (4, 'SAMD00045869', 'DRS029885'),
-                        (5, 'SAMD00045870', 'DRS029886')]
-            assert set(results) == set(expected)
-
-            query = ("select file_id, ena_submission_file_id, file_md5, file_type, file_size  from evapro.file "
-                     "where ena_submission_file_id in ('ERF219841043','ERF219841044')")
-            results = get_all_results_for_query(metadata_connection_handle, query)
-            expected = [(1, 'ERF219841043', '77b3f2576319887b36479474c39bf5e6', 'VCF', 50824503470),
-                        (2, 'ERF219841044', 'bbca217c4ca11a8068b11fb9fb051a5e', 'CSI', 335146)]
-            assert set(results) == set(expected)
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+            assert_expected_state(metadata_connection_handle, load_expected_state('eva_submission_ingestion.yml'))
 
     def assert_data_loaded_to_mongodb(self):
-        with get_mongo_connection_handle(self.maven_profile, self.maven_settings_file) as mongo_conn:
-            variant_database = mongo_conn['eva_spombe_asm294v2']
-
-            files_coll = variant_database["files_2_0"]
-            files_coll_total_count = files_coll.count_documents({})
-            assert files_coll_total_count == 1
-            files_coll_count = files_coll.count_documents(
-                {"fid": "ERZ28769990", "fname": "vcf_file_ASM294v2.vcf.gz", "sid": "PRJEB105137"})
-            assert files_coll_count == 1
-
-            variant_coll = variant_database["variants_2_0"]
-            variant_coll_total_count = variant_coll.count_documents({})
-            assert variant_coll_total_count == 4
-            variant_coll_count = variant_coll.count_documents(
-                {"_id": {"$in": ["CU329670.1_721105_G_T",
-                                 "CU329671.1_721105_G_T",
-                                 "CU329672.1_721105_T_G",
-                                 "X54421.1_3205_A_T"]}})
-            assert variant_coll_count == 4
-
-            annotations_coll = variant_database["annotations_2_0"]
-            annotations_coll_total_count = annotations_coll.count_documents({})
-            assert annotations_coll_total_count == 4
-            annotations_coll_count = annotations_coll.count_documents(
-                {"_id": {"$in": ["CU329671.1_721105_G_T_116_63",
-                                 "X54421.1_3205_A_T_116_63",
-                                 "CU329672.1_721105_T_G_116_63",
-                                 "CU329670.1_721105_G_T_116_63"]}})
-            assert annotations_coll_count == 4
-
-            annotation_metadata_coll = variant_database["annotationMetadata_2_0"]
-            annotation_metadata_total_count = annotation_metadata_coll.count_documents({})
-            assert annotation_metadata_total_count == 1
-            annotation_metadata_count = annotation_metadata_coll.count_documents(
-                {"cachev": "63", "vepv": "116", "is_default": True})
-            assert annotation_metadata_count == 1
-
-            accession_database = mongo_conn["eva_accession_sharded"]
-            sve_coll = accession_database['submittedVariantEntity']
-            accessioned_variants_count = sve_coll.count_documents(
-                {'seq': 'GCA_000002945.2', 'study': 'PRJEB105137', 'tax': 4896})
-            assert accessioned_variants_count == 4
+        wait_for_documents(self.maven_profile, self.maven_settings_file, 'eva_accession_sharded.submittedVariantEntity',
+                           {'seq': 'GCA_000002945.2', 'study': 'PRJEB105137', 'tax': 4896}, min_count=4,
+                           timeout=self.wait_timeout)
+        with mongo_connection(self.maven_profile, self.maven_settings_file) as mongo_conn:
+            assert_mongo_state(mongo_conn, {
+                'eva_spombe_asm294v2.files_2_0': {
+                    'count': 1,
+                    'counts': [{'filter': {"fid": "ERZ28769990", "fname": "vcf_file_ASM294v2.vcf.gz",
+                                           "sid": "PRJEB105137"}, 'count': 1}]
+                },
+                'eva_spombe_asm294v2.variants_2_0': {
+                    'count': 4,
+                    'ids': ["CU329670.1_721105_G_T",
+                            "CU329671.1_721105_G_T",
+                            "CU329672.1_721105_T_G",
+                            "X54421.1_3205_A_T"]
+                },
+                'eva_spombe_asm294v2.annotations_2_0': {
+                    'count': 4,
+                    'ids': ["CU329671.1_721105_G_T_116_63",
+                            "X54421.1_3205_A_T_116_63",
+                            "CU329672.1_721105_T_G_116_63",
+                            "CU329670.1_721105_G_T_116_63"]
+                },
+                'eva_spombe_asm294v2.annotationMetadata_2_0': {
+                    'count': 1,
+                    'counts': [{'filter': {"cachev": "63", "vepv": "116", "is_default": True}, 'count': 1}]
+                },
+                'eva_accession_sharded.submittedVariantEntity': {
+                    'counts': [{'filter': {'seq': 'GCA_000002945.2', 'study': 'PRJEB105137', 'tax': 4896}, 'count': 4}]
+                },
+            })
@@ -4,11 +4,11 @@ import subprocess
 
 import yaml
 from ebi_eva_common_pyutils.config import Configuration
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
 
 from tests.components.eva_submission.test_eva_submission import TestEvaSubmission
-from utils.docker_utils import copy_files_to_container, copy_files_from_container, run_command_in_container
+from utils.connection_pool import metadata_connection
+from utils.docker_utils import copy_files_to_container, run_command_in_container
 from utils.test_utils import run_quiet_command
 from utils.test_with_docker_compose import log_on_failure
 
@@ -45,8 +45,6 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
         # Run validation from command line
         run_quiet_command("run eva_submission validate_submission script", validation_cmd)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                          f'.ELOAD_{self.eload_number}_config.yml')
@@ -77,8 +75,6 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
         # Run validation from command line
         run_quiet_command("run eva_submission validate_submission script", validation_cmd)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                          f'.ELOAD_{self.eload_number}_config.yml')
@@ -116,8 +112,6 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
         )
         run_quiet_command("run eva_submission validate_submission script", validation_cmd)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                          f'.ELOAD_{self.eload_number}_config.yml')
@@ -153,8 +147,6 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
             # command should crash so we don't get here
             assert False
         except subprocess.CalledProcessError:
-            # copy validation output from docker
-            copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
             # assert results
             eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                              f'.ELOAD_{self.eload_number}_config.yml')
@@ -172,7 +164,7 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
         run_quiet_command("run eva_submission prepare_submission script", prepare_cmd)
 
         # Get submission ID from DB
-        with get_metadata_connection_handle(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             submission_id_query = (f"SELECT submission_id FROM eva_submissions.submission_eload "
                                    f"where eload = {self.eload_number}")
             results = get_all_results_for_query(metadata_connection_handle, submission_id_query)
@@ -186,8 +178,6 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
         # Run validation from command line
         run_quiet_command("run eva_submission validate_submission script", validation_cmd)
 
-        # copy validation output from docker
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
         # assert results
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                          f'.ELOAD_{self.eload_number}_config.yml')
@@ -202,10 +192,7 @@ class TestEvaSubmissionValidation(TestEvaSubmission):
             copy_files_to_container(self.container_name, self.container_submission_dir, self.metadata_xlsx)
 
         # Prepare reference genome
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.assembly_reports_dir, 'GCA_000002945.2_assembly_report.txt'))
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.fasta_files_dir, 'GCA_000002945.2.fa'))
+        self.copy_reference_genome()
 
     def assert_validation_pass_in_config(self, eload_config_yml, tasks=[
         'vcf_check', 'assembly_check', 'metadata_check', 'sample_check', 'structural_variant_check',
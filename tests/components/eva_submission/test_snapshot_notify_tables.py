@@ -0,0 +1,48 @@
+import os
+
+from utils.connection_pool import metadata_connection
+from utils.test_with_docker_compose import TestWithDockerCompose, _stop_session_containers
+from utils.wait_utils import notify_trigger
+
+
+def _has_notify_trigger(test_instance, table):
+    with metadata_connection(test_instance.maven_profile, test_instance.maven_settings_file) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass',
+                           (notify_trigger, table))
+            return cursor.fetchone() is not None
+
+
+class SnapshotTestCase(TestWithDockerCompose):
+    """Postgres only stack of the submission compose file, reset from snapshots."""
+    docker_compose_file = os.path.join(TestWithDockerCompose.root_dir, 'components',
+                                       'docker-compose-eva-submission.yml')
+    container_name = 'postgres_db_test'
+    compose_services = ['postgres_db']
+    mongo_container_name = None
+    reset_mode = 'snapshot'
+    test_run_dir = os.path.join(TestWithDockerCompose.tests_directory, 'eva_snapshot_test_run')
+
+
+class TestSnapshotWithoutNotifyTables(SnapshotTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The Postgres templates have to be created by this class, without any notify trigger
+        _stop_session_containers()
+
+    def test_templates_created_without_notify_trigger(self):
+        assert not _has_notify_trigger(self, 'eva_submissions.submission_processing_status')
+
+
+class TestSnapshotWithNotifyTables(SnapshotTestCase):
+    # Runs in the session of the previous class, whose templates have to be created again with the trigger
+    notify_tables = ['eva_submissions.submission_processing_status']
+
+    def test_notify_trigger_installed(self):
+        assert _has_notify_trigger(self, 'eva_submissions.submission_processing_status')
+
+    def test_notify_trigger_kept_after_reset(self):
+        # Each test starts from a clone of the templates, so the trigger has to be in the templates
+        assert _has_notify_trigger(self, 'eva_submissions.submission_processing_status')
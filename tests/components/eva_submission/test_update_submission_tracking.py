@@ -5,11 +5,11 @@ from datetime import date, timedelta
 
 import yaml
 from ebi_eva_common_pyutils.config import Configuration
-from ebi_eva_internal_pyutils.metadata_utils import get_metadata_connection_handle
 from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
 
 from tests.components.eva_submission.test_eva_submission import TestEvaSubmission
-from utils.docker_utils import read_file_from_container, copy_files_to_container, copy_files_from_container
+from utils.connection_pool import metadata_connection
+from utils.docker_utils import read_file_from_container, copy_files_to_container
 from utils.test_utils import run_quiet_command
 from utils.test_with_docker_compose import log_on_failure
 
@@ -65,15 +65,13 @@ class TestEvaSubmissionUpdateSubmissionTracking(TestEvaSubmission):
         run_quiet_command("run eva_submission update_submission_tracking script", update_release_date_cmd)
 
         # Assert results
-        copy_files_from_container(self.container_name, self.container_eload_dir, self.test_run_dir)
         eload_config_file = os.path.join(self.test_run_dir, f'ELOAD_{self.eload_number}',
                                          f'.ELOAD_{self.eload_number}_config.yml')
         config = Configuration(eload_config_file)
         submission_id = config.query('submission', 'submission_id')
         assert submission_id is not None
 
-        metadata_connection_handle = get_metadata_connection_handle(self.maven_profile, self.maven_settings_file)
-        with metadata_connection_handle:
+        with metadata_connection(self.maven_profile, self.maven_settings_file) as metadata_connection_handle:
             submission_details_query = (f"SELECT release_date FROM eva_submissions.submission_tracking_details "
                                         f"where submission_id = '{submission_id}'")
             results = get_all_results_for_query(metadata_connection_handle, submission_details_query)
@@ -101,10 +99,7 @@ class TestEvaSubmissionUpdateSubmissionTracking(TestEvaSubmission):
         copy_files_to_container(self.container_name, self.container_submission_dir, self.metadata_xlsx)
 
         # Prepare reference genome
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.assembly_reports_dir, 'GCA_000002945.2_assembly_report.txt'))
-        copy_files_to_container(self.container_name, self.container_reference_genome_dir,
-                                os.path.join(self.fasta_files_dir, 'GCA_000002945.2.fa'))
+        self.copy_reference_genome()
 
         vcf_file = os.path.join(self.vcf_files_dir, 'vcf_file_ASM294v2.vcf')
         copy_files_to_container(self.container_name, self.container_submission_dir, vcf_file)
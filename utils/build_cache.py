@@ -0,0 +1,119 @@
+import fcntl
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+from utils.compose_utils import get_resolved_compose_services
+from utils.docker_utils import build_from_docker_compose
+from utils.test_utils import run_quiet_command
+
+logger = logging_config.get_logger(__name__)
+
+# Content hash of the last build of each image, with the id of the image it produced
+build_cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'eva_integration_tests', 'build_cache.json')
+build_cache_lock_file = build_cache_file + '.lock'
+
+# Docker compose files already built in this session
+_built_docker_compose_files = set()
+
+
+def _hash_directory(hasher, directory):
+    for root, dir_names, file_names in os.walk(directory):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(root, file_name)
+            hasher.update(os.path.relpath(file_path, directory).encode())
+            with open(file_path, 'rb') as open_file:
+                for chunk in iter(lambda: open_file.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+
+
+def get_build_hash(build):
+    """Hash the build context, the Dockerfile and the build args of a resolved compose service build section."""
+    hasher = hashlib.sha256()
+    context = build['context']
+    _hash_directory(hasher, context)
+    dockerfile = os.path.join(context, build.get('dockerfile', 'Dockerfile'))
+    if not os.path.abspath(dockerfile).startswith(os.path.abspath(context) + os.sep):
+        with open(dockerfile, 'rb') as open_file:
+            hasher.update(open_file.read())
+    hasher.update(json.dumps(build.get('args') or {}, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def _get_image_id(image, docker_path):
+    try:
+        return run_quiet_command('get image id', f"{docker_path} image inspect --format '{{{{.Id}}}}' {image}",
+                                 return_process_output=True).strip()
+    except subprocess.CalledProcessError:
+        return None
+
+
+def _load_build_cache():
+    if not os.path.exists(build_cache_file):
+        return {}
+    try:
+        with open(build_cache_file) as open_file:
+            return json.load(open_file)
+    except ValueError:
+        logger.warning(f'Ignoring unreadable build cache {build_cache_file}')
+        return {}
+
+
+def _save_build_cache(build_cache):
+    # Written to a temporary file then renamed so that the cache is never read half written
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(build_cache_file), suffix='.tmp',
+                                     delete=False) as open_file:
+        json.dump(build_cache, open_file, indent=2, sort_keys=True)
+    os.replace(open_file.name, build_cache_file)
+
+
+@contextmanager
+def _lock_build_cache():
+    # Sessions running at the same time, e.g. pytest-xdist workers, wait for each other so that an image is only built
+    # by the first one and the others find it up to date
+    os.makedirs(os.path.dirname(build_cache_file), exist_ok=True)
+    with open(build_cache_lock_file, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_changed_images(docker_compose_file, docker_path='docker'):
+    """Build the images of a docker compose file whose build context or build args changed since they were built.
+
+    An image is rebuilt when its content hash differs from the one recorded at its last build or when the image
+    recorded against that hash no longer exists (e.g. it was removed with docker image rm). Each docker compose
+    file is only checked once per process, and processes running at the same time build each image only once.
+    """
+    if docker_compose_file in _built_docker_compose_files:
+        return
+    # The lock is held across the check, the build and the save of the cache
+    with _lock_build_cache():
+        build_cache = _load_build_cache()
+        services_to_build = {}
+        for name, service in get_resolved_compose_services(docker_compose_file, docker_path).items():
+            if 'build' not in service:
+                continue
+            image = service.get('image', name)
+            build_hash = get_build_hash(service['build'])
+            cached_build = build_cache.get(image, {})
+            if cached_build.get('hash') == build_hash and \
+                    cached_build.get('image_id') == _get_image_id(image, docker_path):
+                logger.info(f'Image {image} is up to date')
+                continue
+            services_to_build[name] = (image, build_hash)
+
+        if services_to_build:
+            build_from_docker_compose(docker_compose_file, docker_path, services=list(services_to_build))
+            for image, build_hash in services_to_build.values():
+                build_cache[image] = {'hash': build_hash, 'image_id': _get_image_id(image, docker_path)}
+            _save_build_cache(build_cache)
+    _built_docker_compose_files.add(docker_compose_file)
@@ -0,0 +1,99 @@
+import glob
+import hashlib
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+md5_file_name = 'md5checksums.txt'
+# Size of the slices of the mapped files passed to md5
+hash_chunk_size = 16 * 1024 * 1024
+
+
+def parse_md5_checksums(md5_file):
+    """Return the md5 of each file listed in an md5sum formatted file, by file name."""
+    checksums = {}
+    with open(md5_file) as open_file:
+        for line in open_file:
+            if not line.strip():
+                continue
+            md5, file_name = line.rstrip('\n').split(maxsplit=1)
+            # md5sum marks the files read in binary mode with a *
+            checksums[file_name.lstrip('*')] = md5.lower()
+    return checksums
+
+
+def get_md5(file_path):
+    """Return the md5 of a file, reading it through a memory map in large chunks."""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as open_file:
+        # Empty files cannot be mapped
+        if os.fstat(open_file.fileno()).st_size == 0:
+            return md5.hexdigest()
+        with mmap.mmap(open_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            with memoryview(mapped_file) as view:
+                for offset in range(0, len(view), hash_chunk_size):
+                    md5.update(view[offset:offset + hash_chunk_size])
+    return md5.hexdigest()
+
+
+def verify_release_checksums(release_dirs, max_workers=None):
+    """Check the files listed in the md5checksums.txt of every by_species/<species>/<assembly> directory of releases.
+
+    The files are hashed in a pool of processes. Files hard linked to each other, e.g. the files of an assembly that
+    did not change between two releases, are only hashed once. Return a summary with the problems found (missing files
+    and mismatching checksums), the number of files listed and hashed, and the throughput of the hashing.
+    """
+    if isinstance(release_dirs, str):
+        release_dirs = [release_dirs]
+    problems = []
+    expected_checksums = {}
+    for release_dir in release_dirs:
+        md5_files = sorted(glob.glob(os.path.join(release_dir, 'by_species', '*', '*', md5_file_name)))
+        if not md5_files:
+            problems.append(f'No {md5_file_name} found in {release_dir}')
+        for md5_file in md5_files:
+            for file_name, md5 in parse_md5_checksums(md5_file).items():
+                expected_checksums[os.path.join(os.path.dirname(md5_file), file_name)] = md5
+
+    # Only the first path of each inode is hashed
+    paths_by_inode = {}
+    for file_path in expected_checksums:
+        if not os.path.isfile(file_path):
+            problems.append(f'{file_path} is listed in {md5_file_name} but does not exist')
+            continue
+        stat = os.stat(file_path)
+        paths_by_inode.setdefault((stat.st_dev, stat.st_ino), []).append(file_path)
+    files_to_hash = [paths[0] for paths in paths_by_inode.values()]
+    total_bytes = sum(os.path.getsize(file_path) for file_path in files_to_hash)
+
+    start_time = time.monotonic()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        md5s = dict(zip(files_to_hash, executor.map(get_md5, files_to_hash)))
+    elapsed_time = time.monotonic() - start_time
+
+    for paths in paths_by_inode.values():
+        for file_path in paths:
+            if md5s[paths[0]] != expected_checksums[file_path]:
+                problems.append(f'{file_path} has md5 {md5s[paths[0]]} instead of {expected_checksums[file_path]}')
+    throughput = total_bytes / 1024 / 1024 / elapsed_time if elapsed_time else 0
+    logger.info(f'Hashed {len(files_to_hash)} of the {len(expected_checksums)} files listed in {md5_file_name} '
+                f'({total_bytes / 1024 / 1024:.1f} MB) in {elapsed_time:.1f}s at {throughput:.1f} MB/s')
+    return {
+        'problems': problems,
+        'listed_files': len(expected_checksums),
+        'hashed_files': len(files_to_hash),
+        'hashed_bytes': total_bytes,
+        'throughput_mb_per_second': throughput,
+    }
+
+
+def assert_release_checksums(release_dirs, max_workers=None):
+    """Assert that all the files of the releases match their md5checksums.txt and return the verification summary."""
+    summary = verify_release_checksums(release_dirs, max_workers)
+    assert not summary['problems'], f'{len(summary["problems"])} checksum problems:\n' + '\n'.join(summary['problems'])
+    return summary
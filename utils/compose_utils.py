@@ -0,0 +1,72 @@
+import json
+import os
+
+import yaml
+
+from utils.test_utils import run_quiet_command
+
+
+def load_compose_services(docker_compose_file):
+    """Return the services defined in a docker compose file, keyed by service name."""
+    with open(docker_compose_file) as open_file:
+        return yaml.safe_load(open_file)['services']
+
+
+def get_required_dependencies(service):
+    """Return the names of the services a service depends on, skipping the ones marked with required: false."""
+    depends_on = service.get('depends_on') or []
+    if isinstance(depends_on, list):
+        return list(depends_on)
+    return [name for name, options in depends_on.items() if (options or {}).get('required', True)]
+
+
+def get_startup_layers(docker_compose_file, service_names):
+    """Return service_names and their transitive required dependencies grouped in layers that can be started in order.
+
+    Each layer only depends on the services of the previous layers, so all the services of a layer can be started
+    together once the previous layer is up.
+    """
+    services = load_compose_services(docker_compose_file)
+    unknown_services = set(service_names) - set(services)
+    if unknown_services:
+        raise ValueError(f'Services {sorted(unknown_services)} are not defined in {docker_compose_file}')
+
+    dependencies = {}
+    services_to_visit = list(service_names)
+    while services_to_visit:
+        name = services_to_visit.pop()
+        if name not in dependencies:
+            dependencies[name] = set(get_required_dependencies(services[name]))
+            services_to_visit.extend(dependencies[name])
+
+    layers = []
+    started_services = set()
+    while len(started_services) < len(dependencies):
+        layer = sorted(name for name, required in dependencies.items()
+                       if name not in started_services and required <= started_services)
+        if not layer:
+            raise ValueError(f'Circular depends_on between {sorted(set(dependencies) - started_services)} '
+                             f'in {docker_compose_file}')
+        layers.append(layer)
+        started_services.update(layer)
+    return layers
+
+
+def get_resolved_compose_services(docker_compose_file, docker_path='docker'):
+    """Return the services of a docker compose file with environment variables, build args and paths resolved."""
+    config = run_quiet_command('resolve docker compose file',
+                               f'{docker_path} compose -f {docker_compose_file} config --format json',
+                               return_process_output=True)
+    return json.loads(config)['services']
+
+
+def get_writable_bind_mounts(docker_compose_file, host_dir, docker_path='docker'):
+    """Return (container name, host path, container path) of the writable bind mounts whose host path is in host_dir."""
+    bind_mounts = []
+    for name, service in get_resolved_compose_services(docker_compose_file, docker_path).items():
+        for volume in service.get('volumes', []):
+            if volume.get('type') != 'bind' or volume.get('read_only'):
+                continue
+            if os.path.abspath(volume['source']).startswith(os.path.abspath(host_dir) + os.sep):
+                bind_mounts.append((service.get('container_name', name), volume['source'], volume['target']))
+    return bind_mounts
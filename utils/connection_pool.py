@@ -0,0 +1,127 @@
+import atexit
+import collections
+import functools
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import psycopg2
+import pymongo
+from ebi_eva_common_pyutils.logger import logging_config
+from ebi_eva_internal_pyutils.config_utils import get_metadata_creds_for_profile, get_mongo_uri_for_eva_profile
+from psycopg2 import extensions
+
+logger = logging_config.get_logger(__name__)
+
+# Idle metadata connections and Mongo clients of the session, by (maven profile, maven settings file)
+_idle_metadata_connections = collections.defaultdict(list)
+_mongo_clients = {}
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_metadata_connection_args(maven_profile, maven_settings_file):
+    # The settings file is only parsed once per profile
+    pg_url, pg_user, pg_pass = get_metadata_creds_for_profile(maven_profile, maven_settings_file)
+    return urlsplit(pg_url).path, pg_user, pg_pass
+
+
+@functools.lru_cache(maxsize=None)
+def _get_mongo_uri(maven_profile, maven_settings_file):
+    return get_mongo_uri_for_eva_profile(maven_profile, maven_settings_file)
+
+
+def _is_alive(connection):
+    # Connections of the pool are dropped by the server when its container restarts or its database is reset
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        connection.close()
+        return False
+
+
+def new_metadata_connection(maven_profile, maven_settings_file):
+    """Open a connection to the metadata database outside of the pool, e.g. for a session that has to LISTEN."""
+    dsn, user, password = _get_metadata_connection_args(maven_profile, maven_settings_file)
+    return psycopg2.connect(dsn, user=user, password=password)
+
+
+def _take_metadata_connection(key):
+    while True:
+        with _pool_lock:
+            if not _idle_metadata_connections[key]:
+                break
+            connection = _idle_metadata_connections[key].pop()
+        if _is_alive(connection):
+            return connection
+        logger.debug(f'Reconnecting to the metadata database of profile {key[0]}')
+    return new_metadata_connection(*key)
+
+
+def _return_metadata_connection(key, connection):
+    if connection.closed or connection.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        connection.close()
+        return
+    with _pool_lock:
+        _idle_metadata_connections[key].append(connection)
+
+
+@contextmanager
+def metadata_connection(maven_profile, maven_settings_file):
+    """Borrow a connection to the metadata database from the pool of the session.
+
+    Like a connection from get_metadata_connection_handle used in a with block, the transaction is committed when the
+    block completes and rolled back when it raises. The connection is then kept open for the next caller instead of
+    being closed. Connections dropped by the server, e.g. after a container restart, are replaced transparently.
+    """
+    key = (maven_profile, maven_settings_file)
+    connection = _take_metadata_connection(key)
+    try:
+        yield connection
+        connection.commit()
+    except BaseException:
+        if not connection.closed:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                connection.close()
+        raise
+    finally:
+        _return_metadata_connection(key, connection)
+
+
+@contextmanager
+def mongo_connection(maven_profile, maven_settings_file):
+    """Use the Mongo client of the session, which is kept open when the with block completes.
+
+    The client holds its own pool of sockets and reconnects by itself when the Mongo container restarts.
+    """
+    key = (maven_profile, maven_settings_file)
+    with _pool_lock:
+        if key not in _mongo_clients:
+            _mongo_clients[key] = pymongo.MongoClient(_get_mongo_uri(*key), readConcernLevel='majority', w='majority')
+        mongo_client = _mongo_clients[key]
+    yield mongo_client
+
+
+def close_all_connections():
+    """Close the metadata connections and Mongo clients of the session and forget the credentials read for them."""
+    with _pool_lock:
+        for connections in _idle_metadata_connections.values():
+            for connection in connections:
+                connection.close()
+        _idle_metadata_connections.clear()
+        for mongo_client in _mongo_clients.values():
+            mongo_client.close()
+        _mongo_clients.clear()
+    # The host ports of a shard, hence its settings files, change when they are reallocated
+    _get_metadata_connection_args.cache_clear()
+    _get_mongo_uri.cache_clear()
+
+
+atexit.register(close_all_connections)
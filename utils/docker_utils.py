@@ -1,35 +1,143 @@
+import collections
+import contextlib
 import os
-import shutil
+import shlex
 import subprocess
-from tempfile import mkdtemp
+import tarfile
+import tempfile
+import threading
+import time
 
+import docker
 from ebi_eva_common_pyutils.logger import logging_config
 
-from utils.test_utils import run_quiet_command
-
 logger = logging_config.get_logger(__name__)
 
+# Client shared by all the helpers so that a single connection to the Docker socket is kept for the session
+_docker_client = None
+# Number of output lines of a docker CLI command kept in memory to be printed if it fails
+docker_cmd_output_lines = 1000
+# File the output of the docker CLI commands is mirrored to, if any
+_docker_cmd_log_file = None
+
+
+def get_docker_client():
+    """Return the Docker Engine API client, connecting to the Docker socket on first use."""
+    global _docker_client
+    if _docker_client is None:
+        _docker_client = docker.from_env()
+    return _docker_client
+
+
+def _format_output(output):
+    # Same format as the output returned by run_command_with_output for the commands previously run through the CLI
+    if not output:
+        return ''
+    return ''.join(line.rstrip() + '\n' for line in output.decode(errors='replace').splitlines())
+
+
+def _exec_in_container(container_name, command_to_run):
+    api = get_docker_client().api
+    exec_id = api.exec_create(container_name, ['sh', '-c', command_to_run], stdout=True, stderr=True)['Id']
+    stdout, stderr = api.exec_start(exec_id, demux=True)
+    return api.exec_inspect(exec_id)['ExitCode'], _format_output(stdout), _format_output(stderr)
+
+
+class _ContainerCommand:
+    """Command run with sh in its own process group in a container, iterated as (stdout, stderr) chunks.
+
+    The shell prints its process group id before running the command so that the whole process tree can be killed
+    when the command runs for longer than timeout seconds. TimeoutExpired is then raised once the output ends.
+    """
+
+    # setsid --wait keeps the exec attached to the command and reports its exit code
+    wrapper = ['setsid', '--wait', 'sh', '-c', 'echo $$ && exec sh -c "$1"', 'sh']
+    # Seconds given to the process tree to exit after SIGTERM before it is killed
+    kill_grace_period = 10
+
+    def __init__(self, container_name, command_to_run, timeout=None):
+        self.container_name = container_name
+        self.command_to_run = command_to_run
+        self.timeout = timeout
+        self.exit_code = None
+        self.elapsed = None
+        self._timed_out = threading.Event()
+
+    def _kill(self, process_group_id):
+        self._timed_out.set()
+        logger.error(f'Command in {self.container_name} timed out after {self.timeout}s, killing process group '
+                     f'{process_group_id}: {self.command_to_run}')
+        _exec_in_container(
+            self.container_name,
+            f'kill -TERM -- -{process_group_id}; for i in $(seq {self.kill_grace_period}); do '
+            f'kill -0 -- -{process_group_id} 2>/dev/null || exit 0; sleep 1; done; kill -KILL -- -{process_group_id}'
+        )
+
+    def __iter__(self):
+        api = get_docker_client().api
+        exec_id = api.exec_create(self.container_name, self.wrapper + [self.command_to_run],
+                                  stdout=True, stderr=True)['Id']
+        start_time = time.monotonic()
+        # The first line of the standard output is the process group id
+        process_group_id = None
+        first_line = b''
+        timer = None
+        try:
+            for stdout_chunk, stderr_chunk in api.exec_start(exec_id, stream=True, demux=True):
+                if process_group_id is None and stdout_chunk:
+                    first_line += stdout_chunk
+                    if b'\n' not in first_line:
+                        continue
+                    process_group_id, _, stdout_chunk = first_line.partition(b'\n')
+                    if self.timeout:
+                        remaining_time = max(0, self.timeout - (time.monotonic() - start_time))
+                        timer = threading.Timer(remaining_time, self._kill, [int(process_group_id)])
+                        timer.daemon = True
+                        timer.start()
+                yield stdout_chunk, stderr_chunk
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self.elapsed = time.monotonic() - start_time
+        self.exit_code = api.exec_inspect(exec_id)['ExitCode']
+        logger.info(f'Command in {self.container_name} exited with code {self.exit_code} in {self.elapsed:.1f}s: '
+                    f'{self.command_to_run}')
+        if self._timed_out.is_set():
+            raise subprocess.TimeoutExpired(self.command_to_run, self.timeout)
+
+
+def set_docker_cmd_log_file(log_file):
+    """Append the output of the docker CLI commands to log_file, or stop mirroring it when log_file is None."""
+    global _docker_cmd_log_file
+    _docker_cmd_log_file = log_file
+
 
 def run_docker_cmd(description, command):
-    log_file = None
-    log_dir = None
-    try:
-        log_dir = mkdtemp()
-        log_file = os.path.join(log_dir, "docker-log")
-        command_with_log = f'{command} > {log_file} 2>&1'
-        run_quiet_command(description, command_with_log, log_error_stream_to_output=True)
-    except subprocess.CalledProcessError as e:
+    # docker compose has no Engine API equivalent so these commands still go through the CLI. Only the last lines of
+    # their output are kept in memory, to be printed if they fail.
+    logger.debug(f'Starting process: {description}')
+    last_lines = collections.deque(maxlen=docker_cmd_output_lines)
+    with open(_docker_cmd_log_file, 'a') if _docker_cmd_log_file else contextlib.nullcontext() as log_file, \
+            subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as process:
         if log_file:
-            output = read_file_from_local(log_file)
-            print(f'Command {command} {description} failed:')
-            print(output)
-        raise e
-    finally:
-        if os.path.exists(log_dir):
-            shutil.rmtree(log_dir)
+            log_file.write(f'$ {command}\n')
+        for line in process.stdout:
+            line = line.decode(errors='replace').rstrip()
+            last_lines.append(line)
+            if log_file:
+                log_file.write(line + '\n')
+    if process.returncode != 0:
+        output = '\n'.join(last_lines)
+        print(f'Command {command} {description} failed:')
+        print(output)
+        raise subprocess.CalledProcessError(process.returncode, command, output=output)
 
 
-def build_from_docker_compose(docker_compose_file, docker_path='docker'):
+def build_from_docker_compose(docker_compose_file, docker_path='docker', services=None):
+    if services:
+        run_docker_cmd(f"build {', '.join(services)} from docker compose file",
+                       f"{docker_path} compose -f {docker_compose_file} build {' '.join(services)}")
+        return
     run_docker_cmd("build all services defined in docker compose file",
                    f"{docker_path} compose -f {docker_compose_file} build")
 
@@ -44,22 +152,131 @@ def start_all_containers_in_docker_compose(docker_compose_file, docker_path='doc
                    f"{docker_path} compose -f {docker_compose_file} up -d")
 
 
+def start_containers_in_docker_compose(docker_compose_file, services, docker_path='docker'):
+    """Start the given services without their dependencies and wait until they are running or healthy."""
+    run_docker_cmd(f"start {', '.join(services)} from docker compose file",
+                   f"{docker_path} compose -f {docker_compose_file} up -d --wait --no-deps {' '.join(services)}")
+
+
+# The helpers below go through the Docker Engine API. docker_path is only kept for backward compatibility.
+
 def copy_files_to_container(container_name, dir_path, file_path, docker_path='docker'):
-    run_docker_cmd(f"Create directory structure for copying files into container",
-                   f"{docker_path} exec {container_name} mkdir -p {dir_path}")
-    run_docker_cmd(f"Copy file to container",
-                   f"{docker_path} cp {file_path} {container_name}:{dir_path}/{os.path.basename(file_path)}")
+    copy_files_to_container_in_bulk(container_name, {file_path: os.path.join(dir_path, os.path.basename(file_path))})
+
+
+def copy_files_to_container_in_bulk(container_name, container_paths, docker_path='docker'):
+    """Copy local files or directories to the container in a single tar archive.
+
+    container_paths maps each local path to its absolute destination path in the container. Missing parent directories
+    are created by the Docker daemon while the archive is extracted.
+    """
+    with tempfile.TemporaryFile() as archive:
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            for local_path, container_path in container_paths.items():
+                if not os.path.isabs(container_path):
+                    raise ValueError(f'Destination of {local_path} is not an absolute path: {container_path}')
+                tar.add(local_path, arcname=os.path.normpath(container_path).lstrip('/'))
+        logger.debug(f'Copy {len(container_paths)} paths ({archive.tell()} bytes) to {container_name}')
+        archive.seek(0)
+        get_docker_client().api.put_archive(container_name, '/', archive)
+
+
+def _get_archive(container_name, path, archive):
+    # Spool the tar archive of path in the container to the archive file instead of holding it in memory
+    stream, stat = get_docker_client().api.get_archive(container_name, path)
+    for chunk in stream:
+        archive.write(chunk)
+    archive.seek(0)
 
 
 def copy_files_from_container(container_name, dir_path, local_dir_path, docker_path='docker'):
-    run_docker_cmd(f"copy dir from container to local",
-                   f"{docker_path} cp {container_name}:{dir_path}/. {local_dir_path}")
+    """Copy the content of dir_path in the container to local_dir_path, like docker cp container:dir_path/. ."""
+    with tempfile.TemporaryFile() as archive:
+        _get_archive(container_name, dir_path, archive)
+        os.makedirs(local_dir_path, exist_ok=True)
+        with tarfile.open(fileobj=archive) as tar:
+            # The archive is rooted at the basename of dir_path, which is stripped to only copy its content
+            members = []
+            for member in tar.getmembers():
+                _, _, member.name = member.name.partition('/')
+                if member.name:
+                    members.append(member)
+            # The archive comes from the container, so links and paths leaving local_dir_path are rejected
+            tar.extractall(local_dir_path, members=members, filter='data')
+
+
+def _stream_exec_to_file(container_name, command_to_run, output_file):
+    # Write the standard output of the command to output_file as it is produced and return the exit code and the
+    # standard error
+    api = get_docker_client().api
+    exec_id = api.exec_create(container_name, ['sh', '-c', command_to_run], stdout=True, stderr=True)['Id']
+    stderr = b''
+    for stdout_chunk, stderr_chunk in api.exec_start(exec_id, stream=True, demux=True):
+        if stdout_chunk:
+            output_file.write(stdout_chunk)
+        if stderr_chunk:
+            stderr += stderr_chunk
+    return api.exec_inspect(exec_id)['ExitCode'], _format_output(stderr)
+
+
+def download_files_from_container(container_name, dir_path, local_dir_path, include=None, manifest=None,
+                                  compress=False, docker_path='docker'):
+    """Copy only selected files from dir_path in the container to local_dir_path, keeping their relative paths.
+
+    include lists glob patterns relative to dir_path: a file is copied when its path, or the path of one of its parent
+    directories, matches one of the patterns (e.g. 'ELOAD_*/60_eva_public'). As with find -path, * also matches /.
+    manifest lists the relative paths of the files to copy instead. The files are selected and archived in the
+    container and the archive is streamed to a temporary file, so only the selected files are transferred. Set
+    compress to gzip the archive in transit.
+    """
+    if include:
+        matches = ' -o '.join(f'-path {shlex.quote(os.path.join(".", pattern))} '
+                              f'-o -path {shlex.quote(os.path.join(".", pattern, "*"))}' for pattern in include)
+        list_files = f'find . \\( {matches} \\) ! -type d -print0'
+    elif manifest:
+        list_files = 'printf "%s\\0" ' + ' '.join(shlex.quote(os.path.join('.', path)) for path in manifest)
+    else:
+        raise ValueError('Either include or manifest must be provided')
+    compression = ' | gzip -1' if compress else ''
+    # pipefail, where the shell supports it, makes the command fail when find or tar fail
+    command = (f'(set -o pipefail) 2>/dev/null && set -o pipefail; cd {shlex.quote(dir_path)} && '
+               f'{list_files} | tar -c -f - --null --no-recursion -T -{compression}')
+
+    with tempfile.TemporaryFile() as archive:
+        exit_code, stderr = _stream_exec_to_file(container_name, command, archive)
+        if exit_code != 0:
+            logger.error(f'Download from {container_name}:{dir_path} failed with exit code {exit_code}\n{stderr}')
+            raise subprocess.CalledProcessError(exit_code, command, stderr=stderr)
+        logger.debug(f'Downloaded {archive.tell()} bytes from {container_name}:{dir_path}')
+        archive.seek(0)
+        os.makedirs(local_dir_path, exist_ok=True)
+        with tarfile.open(fileobj=archive, mode='r:gz' if compress else 'r:') as tar:
+            tar.extractall(local_dir_path, filter='data')
+
+
+def save_file_tail_from_container(container_name, file_path, local_file_path, max_bytes, docker_path='docker'):
+    """Save the last max_bytes of file_path in the container to local_file_path, gzipped.
+
+    The file is compressed in the container and streamed to local_file_path so that it is never held in memory.
+    Return the size of the file in the container so that callers can tell whether it was truncated.
+    """
+    quoted_path = shlex.quote(file_path)
+    # The size is written to the standard error so that the standard output only holds the compressed tail
+    command = f'wc -c < {quoted_path} >&2 && tail -c {int(max_bytes)} {quoted_path} | gzip -1'
+    os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+    with open(local_file_path, 'wb') as local_file:
+        exit_code, stderr = _stream_exec_to_file(container_name, command, local_file)
+    if exit_code != 0:
+        os.remove(local_file_path)
+        raise subprocess.CalledProcessError(exit_code, command, stderr=stderr)
+    return int(stderr.split()[0])
 
 
 def read_file_from_container(container_name, file_path, docker_path='docker'):
-    return run_quiet_command("read content of the file from container",
-                             f'{docker_path} exec {container_name} cat {file_path}',
-                             return_process_output=True)
+    with tempfile.TemporaryFile() as archive:
+        _get_archive(container_name, file_path, archive)
+        with tarfile.open(fileobj=archive) as tar:
+            return _format_output(tar.extractfile(tar.getmembers()[0]).read())
 
 
 def read_file_from_local(file_path):
@@ -67,7 +284,52 @@ def read_file_from_local(file_path):
         return f.read()
 
 
-def run_command_in_container(container_name, command_to_run, docker_path='docker'):
-    return run_quiet_command("run command in container",
-                             f" {docker_path} exec {container_name} {command_to_run}",
-                             return_process_output=True)
+def run_command_in_container(container_name, command_to_run, docker_path='docker', timeout=None):
+    """Run command_to_run with sh in the container and return its standard output.
+
+    Raise a CalledProcessError holding the standard output and error if the command fails, or a TimeoutExpired once
+    its process tree is killed if it runs for longer than timeout seconds.
+    """
+    logger.debug(f'Run in {container_name}: {command_to_run}')
+    if timeout is None:
+        exit_code, stdout, stderr = _exec_in_container(container_name, command_to_run)
+    else:
+        stdout, stderr = [], []
+        command = _ContainerCommand(container_name, command_to_run, timeout)
+        for stdout_chunk, stderr_chunk in command:
+            stdout.append(stdout_chunk or b'')
+            stderr.append(stderr_chunk or b'')
+        exit_code = command.exit_code
+        stdout, stderr = _format_output(b''.join(stdout)), _format_output(b''.join(stderr))
+    if exit_code != 0:
+        logger.error(f'Command in {container_name} failed with exit code {exit_code}: {command_to_run}\n{stderr}')
+        raise subprocess.CalledProcessError(exit_code, command_to_run, output=stdout, stderr=stderr)
+    return stdout
+
+
+def stream_command_in_container(container_name, command_to_run, timeout=None, docker_path='docker'):
+    """Run command_to_run with sh in the container and yield the lines of its standard output and error as they come.
+
+    Raise a CalledProcessError holding the last lines of output if the command fails, or a TimeoutExpired once its
+    process tree is killed if it runs for longer than timeout seconds.
+    """
+    logger.debug(f'Stream from {container_name}: {command_to_run}')
+    command = _ContainerCommand(container_name, command_to_run, timeout)
+    partial_lines = {'stdout': b'', 'stderr': b''}
+    last_lines = collections.deque(maxlen=50)
+    for stdout_chunk, stderr_chunk in command:
+        for stream, chunk in (('stdout', stdout_chunk), ('stderr', stderr_chunk)):
+            if not chunk:
+                continue
+            *lines, partial_lines[stream] = (partial_lines[stream] + chunk).split(b'\n')
+            for line in lines:
+                line = line.decode(errors='replace').rstrip()
+                last_lines.append(line)
+                yield line
+    for partial_line in partial_lines.values():
+        if partial_line:
+            line = partial_line.decode(errors='replace').rstrip()
+            last_lines.append(line)
+            yield line
+    if command.exit_code != 0:
+        raise subprocess.CalledProcessError(command.exit_code, command_to_run, output='\n'.join(last_lines))
@@ -0,0 +1,102 @@
+import collections
+import json
+import os
+
+import yaml
+from ebi_eva_common_pyutils.logger import logging_config
+from ebi_eva_internal_pyutils.pg_utils import get_all_results_for_query
+
+logger = logging_config.get_logger(__name__)
+
+expected_state_directory = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'tests', 'resources',
+                                                         'expected_state'))
+# Format of the timestamps selected with timestamp_column, which does not depend on the time zone of the server
+timestamp_format = 'YYYY-MM-DD"T"HH24:MI:SS.US'
+
+
+def load_expected_state(expected_state_file):
+    """Read the list of checks of a YAML expected state file.
+
+    A relative expected_state_file is looked up in tests/resources/expected_state.
+    """
+    with open(os.path.join(expected_state_directory, expected_state_file)) as open_file:
+        return yaml.safe_load(open_file)
+
+
+def timestamp_column(column, with_time_zone=False):
+    """Return the SQL expression selecting a timestamp column of a check as text in timestamp_format.
+
+    json_build_object renders timestamp with time zone columns in the time zone of the server, so these are converted
+    to UTC first.
+    """
+    if with_time_zone:
+        column = f"({column} AT TIME ZONE 'UTC')"
+    return f"to_char({column}, '{timestamp_format}')"
+
+
+def _get_columns(check):
+    # Columns map their name to the SQL expression selecting them
+    columns = check.get('columns') or list(dict.fromkeys(column for row in check['rows'] for column in row))
+    if isinstance(columns, dict):
+        return columns
+    return {column: column for column in columns}
+
+
+def _build_query(checks):
+    # Every check selects its rows as JSON objects tagged with its index so that they all fit in one result set
+    selects = []
+    for check_index, check in enumerate(checks):
+        row = ', '.join(f"'{column}', {expression}" for column, expression in _get_columns(check).items())
+        where = f" WHERE {check['where']}" if check.get('where') else ''
+        selects.append(f"(SELECT {check_index} AS check_index, json_build_object({row}) AS row "
+                       f"FROM {check['table']}{where})")
+    return '\nUNION ALL\n'.join(selects)
+
+
+def _to_json_value(value):
+    # Dates and timestamps are rendered by json_build_object in ISO format
+    return value.isoformat()
+
+
+def _row_key(row):
+    return json.dumps(row, sort_keys=True, default=_to_json_value)
+
+
+def get_expected_state_diff(connection, checks):
+    """Compare the content of the database with the expected rows of each check, with a single query.
+
+    Each check is a dict with the table, an optional where clause, the columns to compare and the rows expected for
+    them, as dicts. The columns default to the keys of the expected rows. They can also map each column to the SQL
+    expression selecting it, e.g. timestamp_column(...) so that timestamps are compared in a fixed format and time
+    zone. Rows are compared as multisets regardless of their order, so a row expected twice has to be in the table
+    twice. Return one dict per check that does not match, with the rows that are missing from the database and the
+    ones that were not expected.
+    """
+    if not checks:
+        return []
+    actual_rows = collections.defaultdict(list)
+    for check_index, row in get_all_results_for_query(connection, _build_query(checks)):
+        actual_rows[check_index].append(row)
+
+    diff = []
+    for check_index, check in enumerate(checks):
+        columns = _get_columns(check)
+        expected = collections.Counter(_row_key({column: row.get(column) for column in columns})
+                                       for row in check['rows'])
+        actual = collections.Counter(_row_key(row) for row in actual_rows[check_index])
+        if expected != actual:
+            diff.append({
+                'table': check['table'],
+                'where': check.get('where'),
+                'missing': [json.loads(row) for row in (expected - actual).elements()],
+                'unexpected': [json.loads(row) for row in (actual - expected).elements()],
+            })
+    logger.debug(f'{len(diff)} of {len(checks)} expected state checks do not match')
+    return diff
+
+
+def assert_expected_state(connection, checks):
+    """Assert that the database matches all the checks (see get_expected_state_diff), reporting every mismatch."""
+    diff = get_expected_state_diff(connection, checks)
+    assert not diff, f'{len(diff)} of {len(checks)} tables do not match their expected state:\n' \
+                     f'{yaml.safe_dump(diff, sort_keys=False)}'
@@ -0,0 +1,134 @@
+import io
+import json
+import os
+from datetime import datetime
+
+import yaml
+from bson import Int64
+from ebi_eva_common_pyutils.logger import logging_config
+
+from utils.connection_pool import metadata_connection, mongo_connection
+
+logger = logging_config.get_logger(__name__)
+
+fixtures_directory = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'tests', 'resources', 'fixtures'))
+
+
+def _to_datetime(value):
+    # YAML loads unquoted timestamps as datetime already
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+# Functions converting the values of the fields declared in the types of a Mongo fixture
+mongo_type_converters = {
+    'int64': Int64,
+    'date': _to_datetime,
+}
+
+
+def _to_csv_field(value):
+    # Unquoted empty fields are NULL with COPY ... (FORMAT csv), quoted ones are empty strings
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def load_postgres_fixture(connection, tables):
+    """Insert the rows of a Postgres fixture with one COPY per table, in a single transaction.
+
+    tables maps each table to its list of rows, in the order the tables have to be filled. Instead of a list, a table
+    can map to a dict with its rows and the SQL expression of each column to insert, which can reference the values of
+    the rows as fixture.<key> (e.g. a subquery looking up a generated id). The rows are copied to a temporary table
+    then inserted in the order they are listed. A row conflicting with one already in the table fails the load, since
+    the fixture would then not describe the state the test starts from.
+    """
+    with connection.cursor() as cursor:
+        for table_index, (table, spec) in enumerate(tables.items()):
+            rows = spec['rows'] if isinstance(spec, dict) else spec
+            if not rows:
+                continue
+            keys = list(dict.fromkeys(key for row in rows for key in row))
+            columns = spec.get('columns') if isinstance(spec, dict) else None
+            columns = columns or {key: f'fixture.{key}' for key in keys}
+            fixture_table = f'fixture_{table_index}'
+
+            # Keys that are columns of the table take their type, the others are text
+            selected_keys = ', '.join(key if key in columns else f'NULL::text AS {key}' for key in keys)
+            cursor.execute(f'CREATE TEMP TABLE {fixture_table} ON COMMIT DROP AS '
+                           f'SELECT {selected_keys} FROM {table} WITH NO DATA; '
+                           f'ALTER TABLE {fixture_table} ADD COLUMN fixture_row serial')
+            csv_rows = io.StringIO(''.join(','.join(_to_csv_field(row.get(key)) for key in keys) + '\n'
+                                           for row in rows))
+            cursor.copy_expert(f"COPY {fixture_table} ({', '.join(keys)}) FROM STDIN WITH (FORMAT csv)", csv_rows)
+            cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                           f"SELECT {', '.join(columns.values())} FROM {fixture_table} AS fixture "
+                           f"ORDER BY fixture.fixture_row")
+            if cursor.rowcount != len(rows):
+                raise ValueError(f'Loaded {cursor.rowcount} of the {len(rows)} fixture rows into {table}')
+            logger.debug(f'Loaded {cursor.rowcount} rows into {table}')
+    connection.commit()
+
+
+def add_mongo_types(document, types):
+    """Convert in place the fields of a document listed in types, which maps dotted field paths to type names.
+
+    Paths go through sub-documents and lists of sub-documents, e.g. 'inactiveObjects.start' converts the start of
+    each of the inactive objects.
+    """
+    for path, type_name in types.items():
+        *parent_fields, field = path.split('.')
+        parents = [document]
+        for parent_field in parent_fields:
+            children = []
+            for parent in parents:
+                child = parent.get(parent_field)
+                children.extend(child if isinstance(child, list) else [child])
+            parents = [child for child in children if isinstance(child, dict)]
+        for parent in parents:
+            if parent.get(field) is not None:
+                parent[field] = mongo_type_converters[type_name](parent[field])
+    return document
+
+
+def load_mongo_fixture(mongo_handle, collections, fixture_dir=fixtures_directory, batch_size=1000):
+    """Insert the documents of a Mongo fixture with unordered insert_many batches.
+
+    collections maps each <database>.<collection> to a dict with the documents, or the JSON documents_file relative to
+    fixture_dir holding them, and the types of their fields (see add_mongo_types). Fields of type int64 and date are
+    converted to Int64 and datetime since JSON and YAML would load them as int and str. A document whose key is already
+    in the collection fails the load with a BulkWriteError.
+    """
+    for namespace, spec in collections.items():
+        database, collection = namespace.split('.', 1)
+        documents = spec.get('documents')
+        if documents is None:
+            with open(os.path.join(fixture_dir, spec['documents_file'])) as open_file:
+                documents = json.load(open_file)
+        documents = [add_mongo_types(document, spec.get('types', {})) for document in documents]
+        inserted = 0
+        for start in range(0, len(documents), batch_size):
+            result = mongo_handle[database][collection].insert_many(documents[start:start + batch_size], ordered=False)
+            inserted += len(result.inserted_ids)
+        if inserted != len(documents):
+            raise ValueError(f'Loaded {inserted} of the {len(documents)} fixture documents into {namespace}')
+        logger.debug(f'Loaded {inserted} documents into {namespace}')
+
+
+def load_fixture(fixture_file, maven_profile, maven_settings_file):
+    """Load the postgres tables and the mongo collections of a YAML fixture file into the metadata and Mongo databases.
+
+    A relative fixture_file is looked up in tests/resources/fixtures.
+    """
+    fixture_file = os.path.join(fixtures_directory, fixture_file)
+    with open(fixture_file) as open_file:
+        fixture = yaml.safe_load(open_file)
+    if fixture.get('postgres'):
+        with metadata_connection(maven_profile, maven_settings_file) as connection:
+            load_postgres_fixture(connection, fixture['postgres'])
+    if fixture.get('mongo'):
+        with mongo_connection(maven_profile, maven_settings_file) as mongo_handle:
+            load_mongo_fixture(mongo_handle, fixture['mongo'], os.path.dirname(fixture_file))
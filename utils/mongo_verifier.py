@@ -0,0 +1,64 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+
+def _build_pipeline(spec):
+    # Every expected count and id set of the collection is a facet so that all of them are computed in one pass
+    counts = list(spec.get('counts', []))
+    if 'count' in spec:
+        counts.insert(0, {'filter': {}, 'count': spec['count']})
+    facets = {f'count_{index}': [{'$match': count['filter']}, {'$count': 'n'}] for index, count in enumerate(counts)}
+    if spec.get('ids'):
+        facets['ids'] = [{'$match': {'_id': {'$in': spec['ids']}}}, {'$project': {'_id': 1}}]
+
+    pipeline = [{'$facet': facets}]
+    # Only the documents matched by a facet have to be read, which can then use an index
+    filters = [count['filter'] for count in counts] + ([{'_id': {'$in': spec['ids']}}] if spec.get('ids') else [])
+    if filters and all(filters):
+        pipeline.insert(0, {'$match': {'$or': filters}})
+    return pipeline, counts
+
+
+def _verify_collection(mongo_handle, namespace, spec):
+    database, collection = namespace.split('.', 1)
+    pipeline, counts = _build_pipeline(spec)
+    # The collection may not exist, e.g. when the pipeline tested did not write to it
+    result = next(mongo_handle[database][collection].aggregate(pipeline), None) or {}
+
+    mismatches = []
+    for index, count in enumerate(counts):
+        actual = result[f'count_{index}'][0]['n'] if result.get(f'count_{index}') else 0
+        if actual != count['count']:
+            mismatches.append({'collection': namespace, 'filter': count['filter'], 'expected': count['count'],
+                               'actual': actual})
+    if spec.get('ids'):
+        found_ids = {document['_id'] for document in result.get('ids', [])}
+        missing_ids = [document_id for document_id in spec['ids'] if document_id not in found_ids]
+        if missing_ids:
+            mismatches.append({'collection': namespace, 'missing_ids': missing_ids})
+    return mismatches
+
+
+def get_mongo_state_diff(mongo_handle, collections, max_workers=8):
+    """Compare the documents of Mongo collections with their expected counts and ids, with one aggregation each.
+
+    collections maps each <database>.<collection> to a dict with the expected count of documents in the collection,
+    the expected counts of documents matching filters as a list of {'filter': ..., 'count': ...}, and the ids of
+    documents that must be in the collection, all optional. The collections are checked concurrently. Return the
+    counts that do not match and the ids that are missing.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda item: _verify_collection(mongo_handle, *item), collections.items())
+        diff = [mismatch for mismatches in results for mismatch in mismatches]
+    logger.debug(f'{len(diff)} mismatches in {len(collections)} Mongo collections')
+    return diff
+
+
+def assert_mongo_state(mongo_handle, collections):
+    """Assert that the Mongo collections match their expected state (see get_mongo_state_diff), reporting all issues."""
+    diff = get_mongo_state_diff(mongo_handle, collections)
+    assert not diff, f'{len(diff)} mismatches in Mongo collections:\n{json.dumps(diff, indent=2, default=str)}'
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import shlex
+import tempfile
+import threading
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+from utils.docker_utils import copy_files_to_container_in_bulk, run_command_in_container
+
+logger = logging_config.get_logger(__name__)
+
+# Directory of the containers where the manifest of the synced files and the cached derived files are kept
+container_cache_dir = '/var/cache/eva_integration_tests'
+container_manifest = os.path.join(container_cache_dir, 'manifest')
+
+# Hash of the local files already hashed in this session, with the modification time and size they were hashed at
+_local_hashes = {}
+# The manifest of a container is rewritten by each sync so syncs to the same container are serialised
+_manifest_locks = {}
+
+
+def get_file_hash(local_path):
+    """Return the sha256 of a local file, only reading it again when its size or modification time changed."""
+    stat = os.stat(local_path)
+    cached_hash = _local_hashes.get(local_path)
+    if cached_hash and cached_hash[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached_hash[2]
+    hasher = hashlib.sha256()
+    with open(local_path, 'rb') as open_file:
+        for chunk in iter(lambda: open_file.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    _local_hashes[local_path] = (stat.st_mtime_ns, stat.st_size, hasher.hexdigest())
+    return hasher.hexdigest()
+
+
+def _read_manifest(container_name):
+    # Only the entries whose file is still in the container are returned
+    output = run_command_in_container(
+        container_name,
+        f'[ ! -f {container_manifest} ] || while read -r file_hash path; do '
+        f'[ ! -f "$path" ] || echo "$file_hash $path"; done < {container_manifest}'
+    )
+    manifest = {}
+    for line in output.splitlines():
+        file_hash, _, path = line.partition(' ')
+        manifest[path] = file_hash
+    return manifest
+
+
+def sync_files_to_container(container_name, container_paths):
+    """Copy local files to the container, skipping the ones it already holds with the same content.
+
+    container_paths maps each local file to its absolute destination path in the container. A manifest of the hash of
+    the files synced is kept in the container, so files are only transferred when they are missing or changed, for
+    instance after the container was recreated.
+    """
+    with _manifest_locks.setdefault(container_name, threading.Lock()):
+        manifest = _read_manifest(container_name)
+        paths_to_copy = {}
+        for local_path, container_path in container_paths.items():
+            file_hash = get_file_hash(local_path)
+            if manifest.get(container_path) != file_hash:
+                paths_to_copy[local_path] = container_path
+                manifest[container_path] = file_hash
+        logger.debug(f'{len(paths_to_copy)} of {len(container_paths)} files to sync to {container_name}')
+        if not paths_to_copy:
+            return
+
+        # The updated manifest is copied in the same archive as the files
+        with tempfile.TemporaryDirectory() as local_dir:
+            local_manifest = os.path.join(local_dir, 'manifest')
+            with open(local_manifest, 'w') as open_file:
+                for path, file_hash in sorted(manifest.items()):
+                    open_file.write(f'{file_hash} {path}\n')
+            copy_files_to_container_in_bulk(container_name, {**paths_to_copy, local_manifest: container_manifest})
+
+
+def copy_derived_files_to_container(container_name, local_source, container_dir, derived_file_names, command):
+    """Copy the files derived from a local file by a command run in the container to container_dir.
+
+    The command runs in a cache directory of the container holding a copy of local_source and must create
+    derived_file_names there (e.g. 'bgzip -f file.vcf && bcftools index -c file.vcf.gz'). Its outputs are kept in the
+    container under the hash of local_source and of the command, so the command only runs again when either changed.
+    """
+    derived_hash = hashlib.sha256(f'{get_file_hash(local_source)} {command}'.encode()).hexdigest()
+    cache_dir = os.path.join(container_cache_dir, 'derived', derived_hash)
+    derived_files = ' '.join(shlex.quote(os.path.join(cache_dir, name)) for name in derived_file_names)
+    copy_from_cache = f'mkdir -p {shlex.quote(container_dir)} && cp {derived_files} {shlex.quote(container_dir)}/'
+    output = run_command_in_container(
+        container_name, f'if [ -f {cache_dir}/.complete ]; then {copy_from_cache} && echo cached; fi')
+    if output.strip() == 'cached':
+        logger.debug(f'Copied {derived_file_names} from the cache of {container_name}')
+        return
+    logger.debug(f'Deriving {derived_file_names} from {local_source} in {container_name}')
+    run_command_in_container(container_name, f'rm -rf {cache_dir}')
+    copy_files_to_container_in_bulk(container_name,
+                                    {local_source: os.path.join(cache_dir, os.path.basename(local_source))})
+    run_command_in_container(container_name, f'cd {cache_dir} && {command} && touch .complete && {copy_from_cache}')
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+
+def _run_step(name, function):
+    start_time = time.monotonic()
+    function()
+    logger.debug(f'Setup step {name} took {time.monotonic() - start_time:.1f}s')
+
+
+def run_setup_steps(steps, max_workers=8):
+    """Run setup steps in threads, each one as soon as the steps it depends on have completed.
+
+    steps maps the name of each step to a (function, names of the steps it depends on) tuple. Independent steps run
+    concurrently so the setup takes as long as its longest chain of dependent steps. When a step fails, the steps not
+    started yet are skipped and its exception is raised once the running steps have completed.
+    """
+    unknown_steps = {dependency for _, dependencies in steps.values() for dependency in dependencies} - set(steps)
+    if unknown_steps:
+        raise ValueError(f'Setup steps depend on undefined steps {sorted(unknown_steps)}')
+
+    start_time = time.monotonic()
+    pending_steps = dict(steps)
+    completed_steps = set()
+    running_steps = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            if error is None:
+                for name, (function, dependencies) in list(pending_steps.items()):
+                    if set(dependencies) <= completed_steps:
+                        running_steps[executor.submit(_run_step, name, function)] = name
+                        del pending_steps[name]
+            if not running_steps:
+                break
+            done, _ = wait(running_steps, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running_steps.pop(future)
+                try:
+                    future.result()
+                    completed_steps.add(name)
+                except Exception as e:
+                    logger.error(f'Setup step {name} failed: {e}')
+                    error = error or e
+
+    if error is not None:
+        raise error
+    if pending_steps:
+        raise ValueError(f'Circular dependencies between setup steps {sorted(pending_steps)}')
+    logger.info(f'Ran {len(steps)} setup steps in {time.monotonic() - start_time:.1f}s')
@@ -0,0 +1,118 @@
+import os
+import re
+import socket
+import tempfile
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+# Environment variables read by the docker compose files for their host ports, with the port they default to
+host_port_variables = {
+    'EVA_POSTGRES_HOST_PORT': 5432,
+    'EVA_MONGO_HOST_PORT': 27017,
+    'EVA_ORACLE_HOST_PORT': 1521,
+    'EVA_SUBMISSION_WS_HOST_PORT': 8080,
+    'EVA_CONTIG_ALIAS_HOST_PORT': 8081,
+    'EVA_MOCK_WS_HOST_PORT': 8082,
+    'EVA_WS_HOST_PORT': 8083,
+    'EVA_MOCK_GLOBUS_HOST_PORT': 5000,
+    'EVA_MAILHOG_SMTP_HOST_PORT': 1025,
+    'EVA_MAILHOG_WEB_HOST_PORT': 8025,
+}
+
+# maven settings file generated for the shard of the current process, and the one it was generated from
+_shard_maven_settings_file = None
+_source_maven_settings_file = None
+# Errors of docker compose up when a published port is already bound
+_host_port_conflict_regex = re.compile(r'port is already allocated|address already in use', re.IGNORECASE)
+
+
+def get_shard_id():
+    """Return the shard of the current process: EVA_TEST_SHARD if set, otherwise the pytest-xdist worker id."""
+    shard_id = os.environ.get('EVA_TEST_SHARD') or os.environ.get('PYTEST_XDIST_WORKER')
+    return shard_id.lower() if shard_id else None
+
+
+def add_shard_suffix(name):
+    """Append the shard suffix used by the compose files to a container name or a test run directory."""
+    shard_id = get_shard_id()
+    if not name or not shard_id or name.endswith(f'_{shard_id}'):
+        return name
+    return f'{name}_{shard_id}'
+
+
+def _find_free_port():
+    with socket.socket() as open_socket:
+        open_socket.bind(('', 0))
+        return open_socket.getsockname()[1]
+
+
+def _write_shard_maven_settings(maven_settings_file, shard_id, host_ports):
+    with open(maven_settings_file) as open_file:
+        settings = open_file.read()
+
+    # Only the localhost profile goes through the host ports, the docker profile uses the compose network
+    profile_start = settings.index('<id>localhost</id>')
+    profile_end = settings.index('</profile>', profile_start)
+    localhost_profile = re.sub(
+        r'localhost:(\d+)',
+        lambda match: f'localhost:{host_ports.get(int(match.group(1)), match.group(1))}',
+        settings[profile_start:profile_end]
+    )
+
+    shard_dir = os.path.join(tempfile.gettempdir(), f'eva_integration_tests_{shard_id}')
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_maven_settings_file = os.path.join(shard_dir, os.path.basename(maven_settings_file))
+    with open(shard_maven_settings_file, 'w') as open_file:
+        open_file.write(settings[:profile_start] + localhost_profile + settings[profile_end:])
+    return shard_maven_settings_file
+
+
+def _allocate_host_ports(maven_settings_file, shard_id):
+    global _shard_maven_settings_file
+    host_ports = {}
+    for variable, default_port in host_port_variables.items():
+        host_ports[default_port] = _find_free_port()
+        os.environ[variable] = str(host_ports[default_port])
+    logger.info(f'Shard {shard_id} uses host ports {host_ports}')
+    _shard_maven_settings_file = _write_shard_maven_settings(maven_settings_file, shard_id, host_ports)
+
+
+def activate_shard(maven_settings_file):
+    """Isolate the compose stack of the current process when running sharded.
+
+    Export a compose project name, the suffix of the container and network names and a free host port for each
+    published service, then return a copy of maven_settings_file whose localhost profile uses these ports.
+    Return maven_settings_file unchanged when the process is not part of a shard.
+    """
+    global _source_maven_settings_file
+    shard_id = get_shard_id()
+    if not shard_id:
+        return maven_settings_file
+    if _shard_maven_settings_file:
+        return _shard_maven_settings_file
+
+    os.environ['COMPOSE_PROJECT_NAME'] = f'eva_{shard_id}'
+    os.environ['EVA_TEST_SHARD_SUFFIX'] = f'_{shard_id}'
+    _source_maven_settings_file = maven_settings_file
+    _allocate_host_ports(maven_settings_file, shard_id)
+    return _shard_maven_settings_file
+
+
+def is_host_port_conflict(docker_output):
+    """Tell whether docker compose failed to start because a host port was taken in the meantime."""
+    return bool(docker_output) and bool(_host_port_conflict_regex.search(docker_output))
+
+
+def reallocate_host_ports():
+    """Pick new free host ports for the shard and rewrite its maven settings file, which keeps the same path.
+
+    The free ports are only found when the shard is activated and docker binds them later, when the containers
+    start, so another process can take one of them in between. The containers then fail to start and have to be
+    started again on new ports.
+    """
+    shard_id = get_shard_id()
+    if not shard_id or not _source_maven_settings_file:
+        raise ValueError('Host ports can only be reallocated for an active shard')
+    _allocate_host_ports(_source_maven_settings_file, shard_id)
@@ -0,0 +1,239 @@
+import shlex
+import time
+
+from bson import Timestamp
+from ebi_eva_common_pyutils.logger import logging_config
+from pymongo.errors import PyMongoError
+
+from utils.docker_utils import run_command_in_container
+
+logger = logging_config.get_logger(__name__)
+
+snapshot_dir = '/tmp/eva_test_snapshots'
+
+postgres_root_user = 'root_user'
+template_suffix = '_template'
+
+# Settings whose value is a list of quoted elements, see GUC_LIST_QUOTE in PostgreSQL
+postgres_list_settings = ['search_path', 'temp_tablespaces', 'session_preload_libraries', 'local_preload_libraries']
+
+mongo_root_user = 'root_user'
+mongo_root_password = 'root_pass'
+mongo_system_databases = ['admin', 'config', 'local']
+# Seconds allowed to read the change stream up to the start of a reset, and longest a read blocks on the server
+mongo_change_stream_timeout = 30
+mongo_change_stream_await_ms = 1000
+
+
+def _mongo_auth_options():
+    return f'-u {mongo_root_user} -p {mongo_root_password} --authenticationDatabase admin'
+
+
+def wait_for_postgres(container_name, timeout=300):
+    """Wait until Postgres accepts TCP connections, which only happens once the init scripts have completed."""
+    run_command_in_container(
+        container_name,
+        f"timeout {timeout} sh -c 'until pg_isready -h localhost -U {postgres_root_user}; do sleep 1; done'"
+    )
+
+
+def _run_psql(container_name, *statements):
+    # Each statement is sent with its own -c so that CREATE/DROP DATABASE do not end up in a transaction block
+    commands = ' '.join(f'-c {shlex.quote(statement)}' for statement in statements)
+    return run_command_in_container(
+        container_name, f'psql -U {postgres_root_user} -d postgres -v ON_ERROR_STOP=1 -At {commands}'
+    )
+
+
+def _close_database(database):
+    # Prevent the web services from reconnecting while the database is being copied or dropped
+    return [
+        f'ALTER DATABASE {database} ALLOW_CONNECTIONS false',
+        f"SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '{database}' "
+        f"AND pid <> pg_backend_pid()"
+    ]
+
+
+def _copy_database_settings(container_name, database, target_database):
+    # Generate the ALTER DATABASE statements copying the settings of database to target_database on the server, so
+    # that names and values are quoted by Postgres. The elements of list settings such as search_path are quoted
+    # one by one, since quoting the whole list would make it a single element.
+    list_settings = ', '.join(f"'{name}'" for name in postgres_list_settings)
+    output = _run_psql(
+        container_name,
+        f"SELECT format('ALTER DATABASE %I SET %I TO %s', '{target_database}', name, "
+        f"CASE WHEN name IN ({list_settings}) "
+        f"THEN (SELECT string_agg(quote_literal(btrim(btrim(element), '\"')), ', ' ORDER BY position) "
+        f"FROM unnest(string_to_array(value, ',')) WITH ORDINALITY AS elements(element, position)) "
+        f"ELSE quote_literal(value) END) "
+        f"FROM (SELECT split_part(setting, '=', 1) AS name, substr(setting, strpos(setting, '=') + 1) AS value "
+        f"FROM pg_db_role_setting s JOIN pg_database d ON d.oid = s.setdatabase, unnest(s.setconfig) AS setting "
+        f"WHERE d.datname = '{database}' AND s.setrole = 0) AS settings"
+    )
+    return output.splitlines()
+
+
+def create_postgres_templates(container_name, databases):
+    """Copy each database to a pristine template that reset_postgres_databases can clone from.
+
+    Database level settings (e.g. search_path) are not carried over by CREATE DATABASE ... TEMPLATE so they are stored
+    on the template as well. Existing templates are replaced, so that the templates can be created again during the
+    session.
+    """
+    for database in databases:
+        template = f'{database}{template_suffix}'
+        logger.info(f'Create Postgres template {template} in {container_name}')
+        settings = _copy_database_settings(container_name, database, template)
+        # A database marked as template cannot be dropped
+        drop_template = [f'ALTER DATABASE {template} IS_TEMPLATE false', f'DROP DATABASE {template}'] \
+            if _run_psql(container_name, f"SELECT 1 FROM pg_database WHERE datname = '{template}'") else []
+        _run_psql(
+            container_name,
+            *drop_template,
+            *_close_database(database),
+            f'CREATE DATABASE {template} TEMPLATE {database}',
+            f'ALTER DATABASE {database} ALLOW_CONNECTIONS true',
+            *settings,
+            f'ALTER DATABASE {template} IS_TEMPLATE true ALLOW_CONNECTIONS false'
+        )
+
+
+def reset_postgres_databases(container_name, databases):
+    """Replace each database with a fresh clone of the template created by create_postgres_templates."""
+    for database in databases:
+        template = f'{database}{template_suffix}'
+        logger.info(f'Reset Postgres database {database} from {template} in {container_name}')
+        settings = _copy_database_settings(container_name, template, database)
+        _run_psql(
+            container_name,
+            *_close_database(database),
+            f'DROP DATABASE {database}',
+            f'CREATE DATABASE {database} TEMPLATE {template}',
+            *settings
+        )
+
+
+def snapshot_mongo(container_name):
+    """Dump every database of the Mongo cluster in an archive kept inside the Mongo container."""
+    logger.info(f'Snapshot Mongo cluster in {container_name}')
+    run_command_in_container(container_name, f'mkdir -p {snapshot_dir}')
+    run_command_in_container(
+        container_name,
+        f'mongodump --quiet {_mongo_auth_options()} --archive={snapshot_dir}/mongo.archive'
+    )
+
+
+def restore_mongo(container_name):
+    """Drop every non-system database then restore the archive created by snapshot_mongo."""
+    logger.info(f'Restore Mongo cluster in {container_name}')
+    drop_databases_script = (
+        f"db.adminCommand({{listDatabases: 1}}).databases"
+        f".filter(d => !{mongo_system_databases}.includes(d.name))"
+        f".forEach(d => db.getSiblingDB(d.name).dropDatabase())"
+    )
+    run_command_in_container(
+        container_name,
+        f'mongosh --quiet {_mongo_auth_options()} --eval "{drop_databases_script}"'
+    )
+    excluded_namespaces = ' '.join(f"--nsExclude='{database}.*'" for database in mongo_system_databases)
+    run_command_in_container(
+        container_name,
+        f'mongorestore --quiet {_mongo_auth_options()} --drop {excluded_namespaces} '
+        f'--archive={snapshot_dir}/mongo.archive'
+    )
+
+
+def get_mongo_cluster_time(mongo_handle):
+    """Return the current cluster time, from which a change stream can later be resumed."""
+    return mongo_handle.admin.command('ping')['operationTime']
+
+
+def list_mongo_namespaces(mongo_handle):
+    """Return the (database, collection) pairs present in the cluster, system databases excluded."""
+    namespaces = set()
+    for database in mongo_handle.list_database_names():
+        if database in mongo_system_databases:
+            continue
+        for collection in mongo_handle[database].list_collection_names():
+            namespaces.add((database, collection))
+    return namespaces
+
+
+def _get_resume_token_cluster_time(resume_token):
+    # The _data of a resume token is a hex string starting with a 0x82 type byte followed by the seconds and the
+    # increment of the cluster time of the event, or of the batch for a postBatchResumeToken
+    token_data = (resume_token or {}).get('_data')
+    if not isinstance(token_data, str) or len(token_data) < 18 or not token_data.startswith('82'):
+        return None
+    token_bytes = bytes.fromhex(token_data[2:18])
+    return Timestamp(int.from_bytes(token_bytes[:4], 'big'), int.from_bytes(token_bytes[4:], 'big'))
+
+
+def get_mongo_namespaces_changed_since(mongo_handle, cluster_time, baseline_namespaces, end_cluster_time,
+                                       timeout=mongo_change_stream_timeout):
+    """Return the (database, collection) pairs written between cluster_time and end_cluster_time.
+
+    Writes are read from a cluster wide change stream resumed at cluster_time, so no cursor has to stay open while the
+    test runs. An empty batch does not mean that every write was read, since the shards of a sharded cluster report
+    their events with a delay, so the stream is read until its events or its postBatchResumeToken reach
+    end_cluster_time. TimeoutError is raised when they do not within timeout seconds. Collections created without any
+    write (e.g. by an index creation) do not appear in the change stream and are found by comparing the current
+    collections with baseline_namespaces. A dropped database is reported with a collection set to None.
+    """
+    deadline = time.monotonic() + timeout
+    namespaces = list_mongo_namespaces(mongo_handle) - baseline_namespaces
+    with mongo_handle.watch(start_at_operation_time=cluster_time,
+                            max_await_time_ms=mongo_change_stream_await_ms) as change_stream:
+        while change_stream.alive:
+            change = change_stream.try_next()
+            if change is not None:
+                if 'ns' in change and change['ns'].get('db') not in mongo_system_databases:
+                    namespaces.add((change['ns']['db'], change['ns'].get('coll')))
+                read_cluster_time = change.get('clusterTime')
+            else:
+                read_cluster_time = _get_resume_token_cluster_time(change_stream.resume_token)
+            if read_cluster_time is not None and read_cluster_time >= end_cluster_time:
+                return namespaces
+            if time.monotonic() >= deadline:
+                break
+    raise TimeoutError(f'The Mongo change stream did not reach cluster time {end_cluster_time} within {timeout}s')
+
+
+def reset_mongo_namespaces(container_name, mongo_handle, baseline_namespaces, changed_namespaces):
+    """Drop the changed collections that were not in the baseline and restore the others from the snapshot archive."""
+    dropped_databases = {database for database, collection in changed_namespaces if collection is None}
+    namespaces_to_restore = {
+        (database, collection) for database, collection in baseline_namespaces
+        if database in dropped_databases or (database, collection) in changed_namespaces
+    }
+    for database, collection in changed_namespaces:
+        if collection and (database, collection) not in baseline_namespaces:
+            logger.info(f'Drop Mongo collection {database}.{collection}')
+            mongo_handle[database].drop_collection(collection)
+    if namespaces_to_restore:
+        logger.info(f'Restore Mongo collections {sorted(namespaces_to_restore)} in {container_name}')
+        included_namespaces = ' '.join(
+            f"--nsInclude='{database}.{collection}'" for database, collection in sorted(namespaces_to_restore)
+        )
+        run_command_in_container(
+            container_name,
+            f'mongorestore --quiet {_mongo_auth_options()} --drop {included_namespaces} '
+            f'--archive={snapshot_dir}/mongo.archive'
+        )
+
+
+def reset_changed_mongo_namespaces(container_name, mongo_handle, baseline_namespaces, cluster_time):
+    """Reset only the collections changed since cluster_time, falling back to a full restore if they cannot be found.
+
+    Return the cluster time after the reset, to pass to the next call.
+    """
+    try:
+        end_cluster_time = get_mongo_cluster_time(mongo_handle)
+        changed_namespaces = get_mongo_namespaces_changed_since(mongo_handle, cluster_time, baseline_namespaces,
+                                                                end_cluster_time)
+    except (PyMongoError, TimeoutError) as e:
+        logger.warning(f'Could not list the changed Mongo collections, restoring the whole cluster: {e}')
+        restore_mongo(container_name)
+    else:
+        reset_mongo_namespaces(container_name, mongo_handle, baseline_namespaces, changed_namespaces)
+    return get_mongo_cluster_time(mongo_handle)
@@ -1,26 +1,85 @@
+import atexit
+import collections
 import functools
+import gzip
 import os
 import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
-from utils.docker_utils import build_from_docker_compose, \
-    stop_and_remove_all_containers_in_docker_compose, start_all_containers_in_docker_compose, read_file_from_container
+from ebi_eva_common_pyutils.logger import logging_config
+
+from utils.build_cache import build_changed_images
+from utils.compose_utils import get_startup_layers, get_writable_bind_mounts
+from utils.connection_pool import close_all_connections, mongo_connection
+from utils.docker_utils import stop_and_remove_all_containers_in_docker_compose, \
+    start_all_containers_in_docker_compose, start_containers_in_docker_compose, save_file_tail_from_container, \
+    run_command_in_container, set_docker_cmd_log_file, stream_command_in_container
+from utils.shard_utils import activate_shard, add_shard_suffix, get_shard_id, is_host_port_conflict, \
+    reallocate_host_ports
+from utils.snapshot_utils import create_postgres_templates, reset_postgres_databases, snapshot_mongo, \
+    wait_for_postgres, list_mongo_namespaces, get_mongo_cluster_time, reset_changed_mongo_namespaces
+from utils.wait_utils import install_notify_triggers
+
+logger = logging_config.get_logger(__name__)
+
+# Docker compose file whose containers are kept running for the whole session in snapshot reset mode
+_session_docker_compose_file = None
+# Services started in that session, None when all the services of the docker compose file were started
+_session_compose_services = None
+# Mongo collections present in the snapshot and cluster time from which the next test's writes are tracked
+_session_mongo_namespaces = None
+_session_mongo_cluster_time = None
+# Tables of the metadata database holding the notify trigger in the Postgres templates of the session
+_session_notify_tables = set()
+
+
+def _stop_session_containers():
+    global _session_docker_compose_file
+    if _session_docker_compose_file:
+        stop_and_remove_all_containers_in_docker_compose(_session_docker_compose_file)
+        _session_docker_compose_file = None
+
+
+atexit.register(_stop_session_containers)
+
+
+def _save_log(test_instance, container_name, log_file):
+    local_file = os.path.join(test_instance.log_artifacts_dir, test_instance.id(),
+                              container_name + log_file.replace('/', '_') + '.gz')
+    file_size = save_file_tail_from_container(container_name, log_file, local_file, test_instance.log_tail_bytes)
+    with gzip.open(local_file, 'rt', errors='replace') as open_file:
+        last_lines = collections.deque(open_file, maxlen=test_instance.log_summary_lines)
+    return local_file, file_size, last_lines
 
 
 def _dump_logs(test_instance):
-    if test_instance.container_log_files:
-        for container_name, log_file in test_instance.container_log_files:
-            try:
-                output = read_file_from_container(container_name, log_file)
-                print('Log file: ' + log_file)
-                print(output)
-            except Exception as e:
-                print(f'Failed to read log {log_file} file from {container_name}')
-                print(str(e))
+    # The tail of each log file is saved from all the containers concurrently, only a summary is printed
+    if not test_instance.container_log_files:
+        return
+    log_files = [(add_shard_suffix(container_name), log_file)
+                 for container_name, log_file in test_instance.container_log_files]
+    with ThreadPoolExecutor(max_workers=len(log_files)) as executor:
+        saved_logs = [(container_name, log_file, executor.submit(_save_log, test_instance, container_name, log_file))
+                      for container_name, log_file in log_files]
+    for container_name, log_file, saved_log in saved_logs:
+        try:
+            local_file, file_size, last_lines = saved_log.result()
+        except Exception as e:
+            print(f'Failed to read log {log_file} file from {container_name}')
+            print(str(e))
+            continue
+        truncated = ''
+        if file_size > test_instance.log_tail_bytes:
+            truncated = f', last {test_instance.log_tail_bytes} bytes kept'
+        print(f'Log file: {log_file} from {container_name} ({file_size} bytes{truncated}) saved to {local_file}')
+        print(f'Last {len(last_lines)} lines:')
+        print(''.join(last_lines))
 
 
 class log_on_failure:
-    """Print container log files when an exception is raised.
+    """Save container log files and print their summary when an exception is raised.
 
     As a class-level decorator (test instance extracted from first arg at call time):
         @log_on_failure
@@ -114,20 +173,78 @@ class TestWithDockerCompose(TestCase):
     fasta_files_dir = os.path.join(resources_directory, 'fasta_files')
     assembly_reports_dir = os.path.join(resources_directory, 'assembly_reports')
 
+    maven_settings_file = os.path.join(root_dir, 'components', 'maven-settings.xml')
+    maven_profile = 'localhost'
+
     test_run_dir = None
     docker_compose_file = None
     container_name = None
     container_submission_dir = None
     container_log_files = None
+    # When a test fails, the last log_tail_bytes of each of its container_log_files are saved, gzipped, under
+    # log_artifacts_dir/<test id> and only their last log_summary_lines lines are printed
+    log_artifacts_dir = os.environ.get('EVA_TEST_LOG_DIR', os.path.join(tests_directory, 'test_logs'))
+    log_tail_bytes = int(os.environ.get('EVA_TEST_LOG_TAIL_BYTES', 10 * 1024 * 1024))
+    log_summary_lines = 20
+    # When set, the output of the docker CLI commands run around each test is written to <test id>.log in this directory
+    docker_cmd_log_dir = os.environ.get('EVA_TEST_DOCKER_CMD_LOG_DIR')
+    # Seconds after which the pipelines run in the containers by the tests are killed
+    command_timeout = int(os.environ.get('EVA_TEST_COMMAND_TIMEOUT', 1800))
+    # Seconds the tests wait for the side effects of the pipelines to appear in the databases
+    wait_timeout = int(os.environ.get('EVA_TEST_WAIT_TIMEOUT', 60))
+    # Times a sharded process tries to start its containers, on new host ports when one of them was taken
+    port_allocation_attempts = int(os.environ.get('EVA_TEST_PORT_ALLOCATION_ATTEMPTS', 3))
+    # Services of the docker compose file needed by the tests of the class. Only these and their required depends_on
+    # are started. All the services are started when not set.
+    compose_services = None
+    # Tables of the metadata database the tests of the class wait on with wait_for_rows. Their notify trigger is
+    # installed when the containers start, before the tests run.
+    notify_tables = []
+
+    # 'restart' recreates all the containers around each test.
+    # 'snapshot' starts the containers once per session, snapshots the databases just after start-up and restores
+    # that snapshot before each subsequent test. Postgres databases are cloned from a pristine template copy and
+    # only the Mongo collections written during the previous test are dropped or restored.
+    reset_mode = os.environ.get('EVA_TEST_RESET_MODE', 'restart')
+    postgres_container_name = 'postgres_db_test'
+    postgres_databases = ['metadata_db', 'contig_alias', 'contiguous_id_blocks_db']
+    mongo_container_name = 'mongo_db_test'
+    # Directories in the main container that are emptied between tests in snapshot mode
+    container_dirs_to_reset = []
+    # (container name, host path, container path) of the writable bind mounts of the docker compose file that point to
+    # the tests directory. Their host directories are created before the containers start, so that they are owned by
+    # the current user, and emptied between tests.
+    workspace_mounts = []
 
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        # build and setup images/containers present in the docker compose file
-        build_from_docker_compose(cls.docker_compose_file)
+        cls._use_shard()
+        # build the images of the docker compose file that changed since their last build
+        build_changed_images(cls.docker_compose_file)
+        cls.workspace_mounts = get_writable_bind_mounts(cls.docker_compose_file, cls.tests_directory)
+
+    @classmethod
+    def _use_shard(cls):
+        # When running sharded (e.g. pytest-xdist workers) each process gets its own compose project, container names,
+        # host ports and test run directory so that several stacks can run side by side
+        cls.maven_settings_file = activate_shard(cls.maven_settings_file)
+        cls.container_name = add_shard_suffix(cls.container_name)
+        cls.postgres_container_name = add_shard_suffix(cls.postgres_container_name)
+        cls.mongo_container_name = add_shard_suffix(cls.mongo_container_name)
+        cls.test_run_dir = add_shard_suffix(cls.test_run_dir)
 
     def setUp(self):
-        # stop and remove containers
+        if self.docker_cmd_log_dir:
+            os.makedirs(self.docker_cmd_log_dir, exist_ok=True)
+            set_docker_cmd_log_file(os.path.join(self.docker_cmd_log_dir, f'{self.id()}.log'))
+            self.addCleanup(set_docker_cmd_log_file, None)
+        if self.reset_mode == 'snapshot':
+            self._reset_containers_from_snapshot()
+            return
+
+        # stop and remove containers, including the ones of a snapshot session started by an earlier test class
+        _stop_session_containers()
         stop_and_remove_all_containers_in_docker_compose(self.docker_compose_file)
 
         # delete and recreate the test run dir before starting containers so that
@@ -136,14 +253,145 @@ class TestWithDockerCompose(TestCase):
             if os.path.exists(self.test_run_dir):
                 shutil.rmtree(self.test_run_dir, ignore_errors=True)
             os.makedirs(self.test_run_dir, exist_ok=True)
+        self._empty_workspace()
 
         # start containers
-        start_all_containers_in_docker_compose(self.docker_compose_file)
+        self._start_containers()
+        if self.notify_tables:
+            wait_for_postgres(self.postgres_container_name)
+            install_notify_triggers(self.maven_profile, self.maven_settings_file, self.notify_tables)
 
     def tearDown(self):
+        self._release_workspace()
+        if self.reset_mode == 'snapshot':
+            # containers are kept for the next test so only the content of the test run dir is removed
+            self._empty_test_run_dir()
+            return
+
         # delete test run directory
         if self.test_run_dir and os.path.exists(self.test_run_dir):
             shutil.rmtree(self.test_run_dir, ignore_errors=True)
 
         # stop and remove container
         stop_and_remove_all_containers_in_docker_compose(self.docker_compose_file)
+
+    def stream_command_in_container(self, command_to_run):
+        """Run command_to_run in the main container within command_timeout, logging its output as it is produced."""
+        for line in stream_command_in_container(self.container_name, command_to_run, timeout=self.command_timeout):
+            logger.info(f'{self.container_name}: {line}')
+
+    def get_host_path(self, container_path, container_name=None):
+        """Return the path on the host of container_path, which has to be under a writable bind mount of the container.
+
+        Files written by the containers under these mounts can be read directly instead of being copied out.
+        """
+        container_name = container_name or self.container_name
+        for mount_container_name, host_path, mount_path in self.workspace_mounts:
+            if mount_container_name == container_name and \
+                    (container_path == mount_path or container_path.startswith(mount_path.rstrip('/') + '/')):
+                return os.path.normpath(os.path.join(host_path, os.path.relpath(container_path, mount_path)))
+        raise ValueError(f'{container_path} is not bind mounted from the host in {container_name}')
+
+    def _reset_containers_from_snapshot(self):
+        global _session_docker_compose_file, _session_compose_services, _session_mongo_namespaces, \
+            _session_mongo_cluster_time, _session_notify_tables
+        if _session_docker_compose_file == self.docker_compose_file:
+            if _session_compose_services is not None and \
+                    (not self.compose_services or not set(self.compose_services) <= _session_compose_services):
+                # An earlier test class of the session needed fewer services
+                self._start_containers()
+                _session_compose_services = set(self.compose_services) | _session_compose_services \
+                    if self.compose_services else None
+            self._empty_test_run_dir()
+            reset_postgres_databases(self.postgres_container_name, self.postgres_databases)
+            if not set(self.notify_tables) <= _session_notify_tables:
+                # An earlier test class of the session waited on other tables, the templates are updated once
+                install_notify_triggers(self.maven_profile, self.maven_settings_file, self.notify_tables)
+                create_postgres_templates(self.postgres_container_name, self.postgres_databases)
+                _session_notify_tables.update(self.notify_tables)
+            if self.mongo_container_name:
+                with mongo_connection(self.maven_profile, self.maven_settings_file) as mongo_handle:
+                    _session_mongo_cluster_time = reset_changed_mongo_namespaces(
+                        self.mongo_container_name, mongo_handle, _session_mongo_namespaces,
+                        _session_mongo_cluster_time
+                    )
+            for container_dir in self.container_dirs_to_reset:
+                run_command_in_container(
+                    self.container_name, f"sh -c 'mkdir -p {container_dir} && find {container_dir} -mindepth 1 -delete'"
+                )
+            return
+
+        # Containers from another compose file share the same names so they have to be removed first
+        _stop_session_containers()
+        stop_and_remove_all_containers_in_docker_compose(self.docker_compose_file)
+        if self.test_run_dir:
+            if os.path.exists(self.test_run_dir):
+                shutil.rmtree(self.test_run_dir, ignore_errors=True)
+            os.makedirs(self.test_run_dir, exist_ok=True)
+        self._empty_workspace()
+        self._start_containers()
+        _session_docker_compose_file = self.docker_compose_file
+        _session_compose_services = set(self.compose_services) if self.compose_services else None
+
+        wait_for_postgres(self.postgres_container_name)
+        install_notify_triggers(self.maven_profile, self.maven_settings_file, self.notify_tables)
+        _session_notify_tables = set(self.notify_tables)
+        create_postgres_templates(self.postgres_container_name, self.postgres_databases)
+        if self.mongo_container_name:
+            snapshot_mongo(self.mongo_container_name)
+            with mongo_connection(self.maven_profile, self.maven_settings_file) as mongo_handle:
+                _session_mongo_namespaces = list_mongo_namespaces(mongo_handle)
+                _session_mongo_cluster_time = get_mongo_cluster_time(mongo_handle)
+
+    def _start_containers(self):
+        # The free host ports of a shard can be taken by another process before docker binds them
+        for attempt in range(1, self.port_allocation_attempts + 1):
+            try:
+                self._start_compose_services()
+                return
+            except subprocess.CalledProcessError as e:
+                if attempt == self.port_allocation_attempts or not get_shard_id() \
+                        or not is_host_port_conflict(e.output):
+                    raise
+                logger.warning(f'A host port of shard {get_shard_id()} was taken, starting the containers again on '
+                               f'new ports (attempt {attempt + 1} of {self.port_allocation_attempts})')
+                stop_and_remove_all_containers_in_docker_compose(self.docker_compose_file)
+                reallocate_host_ports()
+                close_all_connections()
+
+    def _start_compose_services(self):
+        if not self.compose_services:
+            start_all_containers_in_docker_compose(self.docker_compose_file)
+            return
+        # Dependencies are started layer by layer since --no-deps makes docker compose ignore their conditions
+        for services in get_startup_layers(self.docker_compose_file, self.compose_services):
+            start_containers_in_docker_compose(self.docker_compose_file, services)
+
+    def _empty_workspace(self):
+        for _, host_path, _ in self.workspace_mounts:
+            shutil.rmtree(host_path, ignore_errors=True)
+            os.makedirs(host_path, exist_ok=True)
+
+    def _release_workspace(self):
+        # Files written through the bind mounts belong to the container user, give them back to the current user so
+        # that they can be removed from the host
+        for container_name, _, container_path in self.workspace_mounts:
+            try:
+                run_command_in_container(container_name, f'chown -R {os.getuid()}:{os.getgid()} {container_path}')
+            except Exception as e:
+                logger.warning(f'Could not change the owner of {container_path} in {container_name}: {e}')
+
+    def _empty_test_run_dir(self):
+        # The directory itself is kept because it can be bind mounted in the running containers
+        if not self.test_run_dir:
+            return
+        os.makedirs(self.test_run_dir, exist_ok=True)
+        for entry in os.listdir(self.test_run_dir):
+            path = os.path.join(self.test_run_dir, entry)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import re
+import time
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+vcf_columns = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
+# Per record hashes are added modulo 2^256 so that the digest of a file does not depend on the order of its records
+# and is computed in constant memory
+_digest_modulus = 2 ** 256
+_header_contig_regex = re.compile(r'^##contig=<ID=([^,>]+)')
+
+
+def read_assembly_report_names(assembly_report):
+    """Map every name of the sequences of an NCBI assembly report to their GenBank accession.
+
+    The sequence name, GenBank accession, RefSeq accession and UCSC style name of each sequence are all mapped.
+    """
+    names = {}
+    with open(assembly_report) as open_file:
+        for line in open_file:
+            if line.startswith('#') or not line.strip():
+                continue
+            columns = line.rstrip('\n').split('\t')
+            for name in (columns[0], columns[4], columns[6], columns[9]):
+                if name != 'na':
+                    names[name] = columns[4]
+    return names
+
+
+def _record_hash(values):
+    return int.from_bytes(hashlib.sha256('\t'.join(values).encode()).digest(), 'big')
+
+
+def get_records_digest(records, hashed_columns=('CHROM', 'POS', 'REF', 'ALT'), contig_names=None):
+    """Return the digest verify_vcf computes for a VCF holding these records, in any order.
+
+    Records are given as dicts of VCF columns or as tab separated lines.
+    """
+    digest = 0
+    for record in records:
+        if isinstance(record, str):
+            record = dict(zip(vcf_columns, record.rstrip('\n').split('\t')))
+        values = [str(record[column]) for column in hashed_columns]
+        if contig_names and 'CHROM' in hashed_columns:
+            chrom_position = hashed_columns.index('CHROM')
+            values[chrom_position] = contig_names.get(values[chrom_position], values[chrom_position])
+        digest = (digest + _record_hash(values)) % _digest_modulus
+    return f'{digest:064x}'
+
+
+def verify_vcf(vcf_file, assembly_report=None, expected_record_count=None, expected_records=None,
+               expected_digest=None, hashed_columns=('CHROM', 'POS', 'REF', 'ALT')):
+    """Read a bgzipped (or plain) VCF once, in constant memory, and return the list of its problems.
+
+    * the records have to be sorted: each contig in a single block and positions increasing within it,
+    * with an assembly report, the contigs of the header and of the records have to be sequences of the assembly,
+    * the number of records has to be expected_record_count,
+    * the multiset of records, restricted to hashed_columns, has to be the one of expected_records or have the
+      expected_digest (see get_records_digest). Contigs are compared by their GenBank accession when an assembly
+      report is given, so the expected records can name them differently.
+    """
+    start_time = time.monotonic()
+    contig_names = read_assembly_report_names(assembly_report) if assembly_report else None
+    if expected_records is not None:
+        expected_digest = get_records_digest(expected_records, hashed_columns, contig_names)
+    indices = [vcf_columns.index(column) for column in hashed_columns]
+    chrom_position = hashed_columns.index('CHROM') if 'CHROM' in hashed_columns else None
+
+    problems = []
+    record_count = 0
+    digest = 0
+    unknown_contigs = set()
+    completed_contigs = set()
+    current_contig = None
+    previous_position = 0
+    unsorted_records = 0
+    open_function = gzip.open if vcf_file.endswith('.gz') else open
+    with open_function(vcf_file, 'rt') as open_file:
+        for line in open_file:
+            if line.startswith('#'):
+                match = _header_contig_regex.match(line)
+                if match and contig_names is not None and match.group(1) not in contig_names:
+                    problems.append(f'Header contig {match.group(1)} is not in {assembly_report}')
+                continue
+            values = line.rstrip('\n').split('\t', len(vcf_columns))
+            record_count += 1
+            contig, position = values[0], int(values[1])
+
+            if contig != current_contig:
+                if contig in completed_contigs:
+                    unsorted_records += 1
+                if current_contig is not None:
+                    completed_contigs.add(current_contig)
+                current_contig = contig
+            elif position < previous_position:
+                unsorted_records += 1
+            previous_position = position
+            if contig_names is not None and contig not in contig_names and contig not in unknown_contigs:
+                unknown_contigs.add(contig)
+                problems.append(f'Contig {contig} of record {record_count} is not in {assembly_report}')
+
+            if expected_digest is not None:
+                hashed_values = [values[index] for index in indices]
+                if contig_names and chrom_position is not None:
+                    hashed_values[chrom_position] = contig_names.get(contig, contig)
+                digest = (digest + _record_hash(hashed_values)) % _digest_modulus
+
+    if unsorted_records:
+        problems.append(f'{unsorted_records} records are not sorted')
+    if expected_record_count is not None and record_count != expected_record_count:
+        problems.append(f'Expected {expected_record_count} records but found {record_count}')
+    if expected_digest is not None and f'{digest:064x}' != expected_digest:
+        problems.append(f'Records do not match the expected ones: digest {digest:064x} instead of {expected_digest}')
+    logger.info(f'Verified {record_count} records of {vcf_file} in {time.monotonic() - start_time:.1f}s')
+    return problems
+
+
+def assert_vcf(vcf_file, **kwargs):
+    """Assert that a VCF passes all the checks of verify_vcf, reporting every problem found."""
+    problems = verify_vcf(vcf_file, **kwargs)
+    assert not problems, f'{vcf_file} has {len(problems)} problems:\n' + '\n'.join(problems)
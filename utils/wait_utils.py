@@ -0,0 +1,116 @@
+import select
+import time
+
+from ebi_eva_common_pyutils.logger import logging_config
+
+from utils.connection_pool import metadata_connection, mongo_connection, new_metadata_connection
+
+logger = logging_config.get_logger(__name__)
+
+# Tables waited on are given a statement level trigger notifying this channel with their oid whenever they are
+# written to
+notify_channel = 'eva_test_table_changes'
+notify_trigger = 'eva_test_notify_table_changes'
+# Longest a Mongo change stream blocks on the server before the deadline of the wait is checked again
+change_stream_await_ms = 1000
+
+
+def install_notify_triggers(maven_profile, maven_settings_file, tables, lock_timeout=10):
+    """Install the statement level trigger wait_for_rows listens to on each table of the metadata database.
+
+    The test harness installs them once the containers have started and before the snapshot templates are created, so
+    that the schema is not changed while a test is checking it. CREATE TRIGGER waits for the writes in progress on the
+    table, for at most lock_timeout seconds.
+    """
+    if not tables:
+        return
+    with metadata_connection(maven_profile, maven_settings_file) as connection, connection.cursor() as cursor:
+        cursor.execute('SET LOCAL lock_timeout = %s', (f'{lock_timeout}s',))
+        for table in tables:
+            schema = table.split('.')[0] if '.' in table else 'public'
+            if _get_notify_table_oid(cursor, table):
+                continue
+            logger.debug(f'Create trigger {notify_trigger} on {table}')
+            cursor.execute(
+                f"CREATE OR REPLACE FUNCTION {schema}.{notify_trigger}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+                f"BEGIN PERFORM pg_notify('{notify_channel}', TG_RELID::text); RETURN NULL; END $$"
+            )
+            cursor.execute(f'CREATE TRIGGER {notify_trigger} AFTER INSERT OR UPDATE OR DELETE ON {table} '
+                           f'FOR EACH STATEMENT EXECUTE PROCEDURE {schema}.{notify_trigger}()')
+
+
+def _get_notify_table_oid(cursor, table):
+    # Return the oid of the table when it has the notify trigger, None otherwise
+    cursor.execute('SELECT tgrelid::text FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass',
+                   (notify_trigger, table))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _wait_for_notification(connection, payload, deadline):
+    # Block on the socket of the connection until the table is notified or the deadline passes
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if select.select([connection], [], [], remaining)[0]:
+            connection.poll()
+            payloads = [notification.payload for notification in connection.notifies]
+            connection.notifies.clear()
+            if payload in payloads:
+                return True
+
+
+def wait_for_rows(maven_profile, maven_settings_file, table, where='TRUE', min_count=1, timeout=60):
+    """Block until a table of the metadata database holds at least min_count rows matching the where clause.
+
+    The rows are only counted again when the trigger installed by install_notify_triggers notifies that the table was
+    written to, so the wait returns as soon as the rows are committed without polling. Return the number of matching
+    rows or raise TimeoutError when the deadline passes first.
+    """
+    deadline = time.monotonic() + timeout
+    connection = new_metadata_connection(maven_profile, maven_settings_file)
+    try:
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            table_oid = _get_notify_table_oid(cursor, table)
+            if not table_oid:
+                raise ValueError(f'{table} has no {notify_trigger} trigger, '
+                                 f'add it to the notify_tables of the test class')
+            # Listen before counting so that no write can be missed in between
+            cursor.execute(f'LISTEN {notify_channel}')
+            while True:
+                cursor.execute(f'SELECT count(*) FROM {table} WHERE {where}')
+                count = cursor.fetchone()[0]
+                if count >= min_count:
+                    return count
+                if not _wait_for_notification(connection, table_oid, deadline):
+                    raise TimeoutError(f'{table} still has {count} rows where {where} after {timeout}s, '
+                                       f'expected at least {min_count}')
+    finally:
+        connection.close()
+
+
+def wait_for_documents(maven_profile, maven_settings_file, namespace, document_filter=None, min_count=1, timeout=60):
+    """Block until a <database>.<collection> holds at least min_count documents matching document_filter.
+
+    The documents are only counted again when a change stream reports that the collection changed, so the wait returns
+    as soon as the documents are written without polling. Return the number of matching documents or raise
+    TimeoutError when the deadline passes first.
+    """
+    deadline = time.monotonic() + timeout
+    database, collection = namespace.split('.', 1)
+    document_filter = document_filter or {}
+    with mongo_connection(maven_profile, maven_settings_file) as mongo_handle:
+        # The stream is opened on the database since the collection may not exist yet. It is opened before counting
+        # so that no write can be missed in between.
+        with mongo_handle[database].watch([{'$match': {'ns.coll': collection}}],
+                                          max_await_time_ms=change_stream_await_ms) as change_stream:
+            while True:
+                count = mongo_handle[database][collection].count_documents(document_filter)
+                if count >= min_count:
+                    return count
+                while change_stream.try_next() is None:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f'{namespace} still has {count} documents matching {document_filter} '
+                                           f'after {timeout}s, expected at least {min_count}')